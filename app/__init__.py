@@ -42,6 +42,13 @@ def create_app() -> Flask:
 
     app.register_blueprint(main_bp)
 
+    # -------------------------
+    # CLI (flask vir ...)
+    # -------------------------
+    from app.cli import vir_cli
+
+    app.cli.add_command(vir_cli)
+
     # -------------------------
     # USER LOADER
     # -------------------------
@@ -0,0 +1,7 @@
+# app/catalog_cache.py
+from __future__ import annotations
+
+from app.versioned_cache import VersionedCache
+
+# catálogos armados una vez (ej: ejercicios por grupo), clave nombre, versión cache_versions
+catalog_cache = VersionedCache(maxsize=16)
@@ -0,0 +1,212 @@
+# app/cli.py
+from __future__ import annotations
+
+import click
+from flask.cli import AppGroup
+
+from app.extensions import db
+from app.models import DiaPlan, AthleteLog
+
+# Uso: flask --app run vir <comando>
+vir_cli = AppGroup("vir", help="Comandos de mantenimiento de VR Training.")
+
+
+@vir_cli.command("compact-defaults")
+@click.option("--dry-run", is_flag=True, help="Solo cuenta, no borra.")
+def compact_defaults(dry_run: bool) -> None:
+    """
+    Borra filas 'vacías' creadas por lecturas viejas (GET que insertaban):
+    DiaPlan 'Descanso' sin texto/comentario/score y AthleteLog sin nada marcado.
+    Las lecturas ya sintetizan esos días en memoria.
+    """
+    plans_q = DiaPlan.query.filter(
+        DiaPlan.plan_type == "Descanso",
+        DiaPlan.warmup == "",
+        DiaPlan.main == "",
+        DiaPlan.finisher == "",
+        DiaPlan.puede_entrenar == "si",
+        DiaPlan.comentario_atleta == "",
+        DiaPlan.propuesto_score == 0,
+    )
+    logs_q = AthleteLog.query.filter(
+        AthleteLog.did_train.is_(False),
+        AthleteLog.warmup_done == "",
+        AthleteLog.main_done == "",
+        AthleteLog.finisher_done == "",
+    )
+
+    if dry_run:
+        click.echo(f"dia_plan a borrar: {plans_q.count()}")
+        click.echo(f"athlete_logs a borrar: {logs_q.count()}")
+        return
+
+    n_plans = plans_q.delete(synchronize_session=False)
+    n_logs = logs_q.delete(synchronize_session=False)
+    db.session.commit()
+    click.echo(f"✅ Compactado: dia_plan={n_plans} athlete_logs={n_logs}")
+
+
+@vir_cli.command("backfill-streaks")
+def backfill_streaks() -> None:
+    """Rearma athlete_streaks para todos los atletas (1 query gaps-and-islands)."""
+    from app.models import User
+    from app.routes import streak_islands, store_streak
+
+    islands = streak_islands()
+    user_ids = [uid for (uid,) in db.session.query(User.id).all()]
+    for uid in user_ids:
+        store_streak(uid, islands.get(uid))
+    db.session.commit()
+    click.echo(f"✅ Rachas recalculadas: {len(user_ids)} usuarios ({len(islands)} con entrenos)")
+
+
+@vir_cli.command("compile-blocks")
+@click.option("--batch", default=500, show_default=True, help="Filas por lote.")
+def compile_blocks(batch: int) -> None:
+    """Compila DiaPlan.blocks en filas legacy (blocks NULL)."""
+    from app.routes import _compile_plans_blocks
+
+    total = 0
+    while True:
+        plans = DiaPlan.query.filter(DiaPlan.blocks.is_(None)).limit(batch).all()
+        if not plans:
+            break
+        _compile_plans_blocks(plans)
+        db.session.commit()
+        total += len(plans)
+    click.echo(f"✅ Bloques compilados: {total}")
+
+
+@vir_cli.command("backfill-muscle-groups")
+@click.option("--all", "recompute_all", is_flag=True, help="Recalcula también filas ya completas.")
+def backfill_muscle_groups(recompute_all: bool) -> None:
+    """Completa Ejercicio.grupo_muscular desde categoria e invalida el catálogo."""
+    from app.models import Ejercicio
+    from app.routes import categoria_to_muscle_group, bump_cache_version, CATALOG_EJERCICIOS
+
+    q = db.session.query(Ejercicio.id, Ejercicio.categoria, Ejercicio.grupo_muscular)
+    if not recompute_all:
+        q = q.filter(Ejercicio.grupo_muscular.is_(None))
+
+    updates = []
+    for eid, categoria, actual in q.all():
+        grupo = categoria_to_muscle_group(categoria or "")
+        if grupo != actual:
+            updates.append({"id": eid, "grupo_muscular": grupo})
+
+    if updates:
+        db.session.execute(db.update(Ejercicio), updates)
+        bump_cache_version(CATALOG_EJERCICIOS)
+    db.session.commit()
+    click.echo(f"✅ Grupos musculares actualizados: {len(updates)}")
+
+
+@vir_cli.command("search-index")
+@click.option("--all", "recompute_all", is_flag=True, help="Recalcula search_text de todas las filas.")
+def search_index(recompute_all: bool) -> None:
+    """Completa Ejercicio.search_text y crea el índice de texto (pg_trgm / FTS5)."""
+    from app.search import backfill_search_text, ensure_search_index
+
+    n = backfill_search_text(recompute_all)
+    db.session.commit()
+    backend = ensure_search_index()
+    click.echo(f"✅ search_text actualizados: {n} · índice: {backend}")
+
+
+@vir_cli.command("rebuild-adherence")
+@click.option("--from", "date_from", default=None, help="YYYY-MM-DD (default: primer día con datos).")
+@click.option("--to", "date_to", default=None, help="YYYY-MM-DD (default: último día con datos).")
+@click.option("--batch", default=200, show_default=True, help="Atletas por lote.")
+def rebuild_adherence(date_from: str | None, date_to: str | None, batch: int) -> None:
+    """Rearma athlete_day_stats (rollup de adherencia) por lotes de atletas."""
+    from datetime import date
+    from app.models import User, AthleteCheck
+    from app.routes import refresh_day_stats, _as_date
+
+    bounds = [
+        db.session.query(db.func.min(m.fecha), db.func.max(m.fecha)).one()
+        for m in (DiaPlan, AthleteLog, AthleteCheck)
+    ]
+    lows = [_as_date(lo) for lo, _ in bounds if lo is not None]
+    highs = [_as_date(hi) for _, hi in bounds if hi is not None]
+    if not lows:
+        click.echo("Sin datos.")
+        return
+
+    start = date.fromisoformat(date_from) if date_from else min(lows)
+    end = date.fromisoformat(date_to) if date_to else max(highs)
+
+    user_ids = [uid for (uid,) in db.session.query(User.id).order_by(User.id).all()]
+    total = 0
+    for i in range(0, len(user_ids), batch):
+        total += refresh_day_stats(user_ids[i:i + batch], start, end)
+        db.session.commit()
+    click.echo(f"✅ Adherencia recalculada {start} → {end}: {total} filas, {len(user_ids)} usuarios")
+
+
+@vir_cli.command("strava-sync")
+@click.option("--user-id", type=int, default=None, help="Solo este atleta (default: todas las cuentas vinculadas).")
+@click.option("--full", is_flag=True, help="Backfill completo del historial.")
+@click.option("--max-pages", type=int, default=None, help="Corta la corrida (queda el cursor para seguir).")
+def strava_sync(user_id: int | None, full: bool, max_pages: int | None) -> None:
+    """Sincroniza actividades de Strava (incremental por defecto, reanudable)."""
+    from app.models import IntegrationAccount
+    from app.integrations.strava_sync import sync_activities
+
+    q = db.session.query(IntegrationAccount.user_id).filter(
+        IntegrationAccount.provider == "strava",
+        IntegrationAccount.refresh_token.isnot(None),
+    )
+    if user_id:
+        q = q.filter(IntegrationAccount.user_id == user_id)
+
+    for (uid,) in q.order_by(IntegrationAccount.user_id).all():
+        try:
+            st = sync_activities(uid, full=full, max_pages=max_pages)
+        except Exception as e:
+            db.session.rollback()
+            click.echo(f"❌ user {uid}: {e}")
+            continue
+        estado = "completo" if st["done"] else "pendiente (cursor guardado)"
+        click.echo(f"✅ user {uid} [{st['mode']}]: {st['pages']} páginas, "
+                   f"{st['fetched']} leídas, {st['inserted']} nuevas, {st['updated']} actualizadas, "
+                   f"{st['unchanged']} sin cambios · {estado}")
+
+
+@vir_cli.command("strava-enqueue")
+@click.option("--user-id", type=int, default=None, help="Solo este atleta (default: todas las cuentas).")
+@click.option("--full", is_flag=True, help="Backfill completo del historial.")
+def strava_enqueue(user_id: int | None, full: bool) -> None:
+    """Encola syncs de Strava para el worker (sin llamar a la API)."""
+    from app.integrations.strava_worker import enqueue_sync, enqueue_all_accounts, PRIORITY_MANUAL
+
+    if user_id:
+        enqueue_sync(user_id, priority=PRIORITY_MANUAL, full=full)
+        n = 1
+    else:
+        n = enqueue_all_accounts()
+    db.session.commit()
+    click.echo(f"✅ Syncs encolados: {n}")
+
+
+@vir_cli.command("strava-worker")
+@click.option("--concurrency", default=4, show_default=True, help="Threads del pool.")
+@click.option("--interval", default=900, show_default=True, help="Segundos entre agendas de todas las cuentas (0 = no agendar).")
+@click.option("--poll", default=5.0, show_default=True, help="Segundos entre consultas a la cola.")
+@click.option("--once", is_flag=True, help="Corre los jobs listos y termina.")
+def strava_worker(concurrency: int, interval: int, poll: float, once: bool) -> None:
+    """Worker de sync de Strava (cola en DB + token bucket 15 min / diario)."""
+    from flask import current_app
+    from app.integrations.strava_worker import run_worker
+
+    app = current_app._get_current_object()
+    click.echo(f"🚀 strava-worker concurrency={concurrency}")
+    counts = run_worker(
+        app,
+        concurrency=concurrency,
+        once=once,
+        poll_seconds=poll,
+        schedule_every=interval or None,
+        log=click.echo,
+    )
+    click.echo(f"✅ Fin: {counts}")
@@ -0,0 +1,18 @@
+# app/db_utils.py
+from __future__ import annotations
+
+from app.extensions import db
+
+
+def db_dialect() -> str:
+    """'postgresql' | 'sqlite' | ... (para SQL específico de motor)."""
+    return db.session.get_bind().dialect.name
+
+
+def dialect_insert(table):
+    """insert() con ON CONFLICT según motor (Postgres / SQLite)."""
+    if db_dialect() == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as pg_insert
+        return pg_insert(table)
+    from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+    return sqlite_insert(table)
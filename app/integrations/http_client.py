@@ -0,0 +1,171 @@
+# app/integrations/http_client.py
+from __future__ import annotations
+
+import os
+import time
+import random
+import threading
+from collections import deque
+from typing import Any, Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+# (connect, read) en segundos
+HTTP_TIMEOUT = (
+    float(os.getenv("STRAVA_HTTP_CONNECT_TIMEOUT", "3.05")),
+    float(os.getenv("STRAVA_HTTP_READ_TIMEOUT", "20")),
+)
+HTTP_POOL_SIZE = int(os.getenv("STRAVA_HTTP_POOL", "16"))
+HTTP_RETRIES = int(os.getenv("STRAVA_HTTP_RETRIES", "3"))
+HTTP_BACKOFF_BASE = 0.5
+HTTP_BACKOFF_CAP = 8.0
+# Retry-After más largo que esto no se espera acá: se devuelve la respuesta (el worker reagenda)
+HTTP_MAX_RETRY_AFTER = 30.0
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+_SESSION: Dict[str, Optional[requests.Session]] = {"s": None}
+_SESSION_LOCK = threading.Lock()
+
+
+class HttpMetrics:
+    """Latencia / errores / reintentos por endpoint (por proceso, thread-safe)."""
+
+    def __init__(self, window: int = 500):
+        self.window = window
+        self._data: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, name: str, seconds: float, status: Optional[int], retried: bool) -> None:
+        with self._lock:
+            m = self._data.setdefault(name, {
+                "calls": 0, "errors": 0, "retries": 0, "total_s": 0.0, "max_s": 0.0,
+                "last": deque(maxlen=self.window),
+            })
+            m["calls"] += 1
+            m["retries"] += 1 if retried else 0
+            m["errors"] += 1 if (status is None or status >= 400) else 0
+            m["total_s"] += seconds
+            m["max_s"] = max(m["max_s"], seconds)
+            m["last"].append(seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out = {}
+            for name, m in self._data.items():
+                last = sorted(m["last"])
+                pick = (lambda q: round(last[min(len(last) - 1, int(q * len(last)))] * 1000, 1)) if last else (lambda q: None)
+                out[name] = {
+                    "calls": m["calls"],
+                    "errors": m["errors"],
+                    "retries": m["retries"],
+                    "avg_ms": round(m["total_s"] / m["calls"] * 1000, 1) if m["calls"] else 0.0,
+                    "p50_ms": pick(0.50),
+                    "p95_ms": pick(0.95),
+                    "max_ms": round(m["max_s"] * 1000, 1),
+                }
+            return out
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+http_metrics = HttpMetrics()
+
+
+def get_session() -> requests.Session:
+    """Session compartida: keep-alive + pool (un handshake TCP/TLS por conexión, no por call)."""
+    s = _SESSION["s"]
+    if s is not None:
+        return s
+    with _SESSION_LOCK:
+        if _SESSION["s"] is None:
+            s = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE, max_retries=0)
+            s.mount("https://", adapter)
+            s.mount("http://", adapter)
+            s.headers.update({"Accept": "application/json"})
+            _SESSION["s"] = s
+        return _SESSION["s"]
+
+
+def _backoff(attempt: int, resp: Optional[requests.Response]) -> Optional[float]:
+    """Segundos a esperar antes del próximo intento (Retry-After manda). None = no reintentar."""
+    if resp is not None and resp.headers.get("Retry-After") is not None:
+        try:
+            ra = float(resp.headers["Retry-After"])
+        except ValueError:
+            ra = None
+        if ra is not None:
+            return ra if ra <= HTTP_MAX_RETRY_AFTER else None
+    if resp is not None and resp.status_code == 429:
+        return None   # sin Retry-After: la ventana es de 15 min, que decida el caller
+    # full jitter
+    return random.uniform(0, min(HTTP_BACKOFF_CAP, HTTP_BACKOFF_BASE * 2 ** attempt))
+
+
+def _never_sent(e: requests.ConnectionError) -> bool:
+    """True si no se llegó a conectar (el request seguro no salió); un reset a mitad no cuenta."""
+    if isinstance(e, requests.ConnectTimeout):
+        return True
+    reason = getattr(e.args[0], "reason", None) if e.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+def request(method: str, url: str, *, name: Optional[str] = None, idempotent: Optional[bool] = None,
+            retries: int = HTTP_RETRIES, timeout=HTTP_TIMEOUT, limiter=None, **kwargs) -> requests.Response:
+    """
+    ✅ Request con la session compartida, timeouts (connect, read) y reintentos con backoff
+    jitter en errores de conexión / 429 / 5xx (respeta Retry-After).
+    idempotent=False (ej: canjear un code OAuth, refresh de token): solo se reintenta si
+    no se pudo conectar (el request no salió) o el server dijo 429/503.
+    limiter (RateBudget): un token por intento + recalibración con los headers de Strava.
+    Devuelve la última respuesta (el caller decide raise_for_status); relanza el último
+    error de red si no hubo ninguna.
+    """
+    method = method.upper()
+    idempotent = method in ("GET", "HEAD", "OPTIONS", "PUT", "DELETE") if idempotent is None else idempotent
+    name = name or f"{method} {url.split('?')[0]}"
+    session = get_session()
+
+    attempt = 0
+    while True:
+        if limiter is not None:
+            limiter.acquire()
+        t0 = time.perf_counter()
+        resp = None
+        try:
+            resp = session.request(method, url, timeout=timeout, **kwargs)
+        except requests.ConnectionError as e:
+            err: Optional[Exception] = e
+            retryable = idempotent or _never_sent(e)
+        except requests.Timeout as e:
+            err = e
+            retryable = idempotent
+        else:
+            err = None
+            if limiter is not None:
+                limiter.observe(resp.headers)
+            retryable = resp.status_code in RETRY_STATUS and (idempotent or resp.status_code in (429, 503))
+
+        wait_s = _backoff(attempt, resp) if retryable and attempt < retries else None
+        http_metrics.record(name, time.perf_counter() - t0, resp.status_code if resp is not None else None,
+                            retried=wait_s is not None)
+
+        if wait_s is None:
+            if resp is None:
+                raise err
+            return resp
+        time.sleep(wait_s)
+        attempt += 1
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    return request("GET", url, **kwargs)
+
+
+def post(url: str, **kwargs) -> requests.Response:
+    return request("POST", url, **kwargs)
@@ -3,10 +3,37 @@ from __future__ import annotations
 
 import os
 import time
-import requests
+
+from app.integrations import http_client
 
 
 STRAVA_TOKEN_URL = "https://www.strava.com/oauth/token"
+STRAVA_API_BASE = "https://www.strava.com/api/v3"
+
+
+def strava_api_base() -> str:
+    """Base de la API (env STRAVA_API_BASE: apuntar a un stub local en pruebas)."""
+    return (os.getenv("STRAVA_API_BASE") or STRAVA_API_BASE).rstrip("/")
+
+
+def strava_token_url() -> str:
+    return os.getenv("STRAVA_TOKEN_URL") or STRAVA_TOKEN_URL
+
+
+class StravaRateLimited(RuntimeError):
+    """429 de Strava. retry_after = segundos hasta que conviene reintentar."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Strava rate limit (reintentar en {int(retry_after)}s)")
+        self.retry_after = float(retry_after)
+
+
+def retry_after_seconds(headers) -> float:
+    """Retry-After si viene; si no, hasta el próximo cuarto de hora (ventana de 15 min de Strava)."""
+    try:
+        return max(1.0, float(headers.get("Retry-After")))
+    except (TypeError, ValueError):
+        return 900.0 - (time.time() % 900.0) + 1.0
 
 
 def exchange_code_for_token(code: str) -> dict:
@@ -23,7 +50,8 @@ def exchange_code_for_token(code: str) -> dict:
         "grant_type": "authorization_code",
     }
 
-    r = requests.post(STRAVA_TOKEN_URL, data=data, timeout=20)
+    # el code es de un solo uso: no reintentar si pudo haber llegado al server
+    r = http_client.post(strava_token_url(), data=data, name="strava.token.exchange", idempotent=False)
     r.raise_for_status()
     return r.json()
 
@@ -42,11 +70,12 @@ def refresh_access_token(refresh_token: str) -> dict:
         "refresh_token": refresh_token,
     }
 
-    r = requests.post(STRAVA_TOKEN_URL, data=data, timeout=20)
+    # Strava rota el refresh_token: si el POST llegó y se reintenta, el token enviado ya no vale
+    r = http_client.post(strava_token_url(), data=data, name="strava.token.refresh", idempotent=False)
     r.raise_for_status()
     return r.json()
 
 
-def is_expired(expires_at: int) -> bool:
-    # 60s de margen
-    return int(expires_at) <= int(time.time()) + 60
+def is_expired(expires_at: int, margin: int = 60) -> bool:
+    # 60s de margen por defecto; el worker usa un margen mayor para refrescar antes
+    return int(expires_at) <= int(time.time()) + int(margin)
@@ -1,14 +1,26 @@
 # app/integrations/strava_sync.py
 from __future__ import annotations
 
-import requests
+import os
+import json
+import time
+import hashlib
+import threading
 from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import requests
 
 from app.extensions import db
-from app.models_strava import IntegrationAccount, ExternalActivity
-from app.integrations.strava_client import refresh_access_token, is_expired
+from app.db_utils import db_dialect, dialect_insert
+from app.models_strava import IntegrationAccount, ExternalActivity, SyncJob
+from app.integrations import http_client
+from app.integrations.strava_client import (
+    refresh_access_token, is_expired, strava_api_base, StravaRateLimited, retry_after_seconds,
+)
 
-STRAVA_ACTIVITIES_URL = "https://www.strava.com/api/v3/athlete/activities"
+# máximo que acepta Strava por página
+STRAVA_PER_PAGE = 200
 
 
 def _parse_start_date(v) -> datetime | None:
@@ -23,68 +35,351 @@ def _parse_start_date(v) -> datetime | None:
         return None
 
 
-def _ensure_valid_token(acc: IntegrationAccount) -> IntegrationAccount:
+# single-flight por cuenta dentro del proceso (entre procesos: SELECT ... FOR UPDATE)
+_REFRESH_LOCKS: Dict[int, threading.Lock] = {}
+_REFRESH_LOCKS_GUARD = threading.Lock()
+
+# el worker refresca tokens que vencen dentro de esta ventana (segundos)
+STRAVA_REFRESH_AHEAD = int(os.getenv("STRAVA_REFRESH_AHEAD", "1800"))
+
+
+def _refresh_lock(account_id: int) -> threading.Lock:
+    with _REFRESH_LOCKS_GUARD:
+        return _REFRESH_LOCKS.setdefault(account_id, threading.Lock())
+
+
+def _refresh_if_needed(acc: IntegrationAccount, margin: int = 60):
+    """
+    ✅ Refresh serializado por cuenta: lock en proceso + fila bloqueada (FOR UPDATE) y
+    re-chequeo de expires_at ya con el lock. Si otro thread/worker refrescó mientras
+    esperábamos, se usa su token (Strava invalida los refresh_token viejos).
+    Devuelve (cuenta, True si ESTA llamada pidió un token nuevo).
+    """
     if not acc.refresh_token:
         raise RuntimeError("No hay refresh_token guardado.")
 
-    if acc.expires_at and not is_expired(acc.expires_at):
-        return acc
+    if acc.expires_at and not is_expired(acc.expires_at, margin):
+        return acc, False
 
-    data = refresh_access_token(acc.refresh_token)
+    with _refresh_lock(acc.id):
+        acc = (
+            IntegrationAccount.query.filter_by(id=acc.id)
+            .populate_existing()
+            .with_for_update()
+            .one()
+        )
+        if acc.expires_at and not is_expired(acc.expires_at, margin):
+            db.session.commit()   # libera la fila
+            return acc, False
 
-    acc.access_token = data.get("access_token")
-    acc.refresh_token = data.get("refresh_token") or acc.refresh_token
-    acc.expires_at = int(data.get("expires_at") or 0)
-    acc.updated_at = datetime.utcnow()
+        try:
+            data = refresh_access_token(acc.refresh_token)
+        except Exception:
+            db.session.rollback()
+            raise
 
-    db.session.commit()
-    return acc
+        acc.access_token = data.get("access_token")
+        acc.refresh_token = data.get("refresh_token") or acc.refresh_token
+        acc.expires_at = int(data.get("expires_at") or 0)
+        acc.updated_at = datetime.utcnow()
 
+        db.session.commit()
+    return acc, True
 
-def sync_latest_activities(user_id: int, per_page: int = 30) -> int:
-    acc = IntegrationAccount.query.filter_by(user_id=user_id, provider="strava").first()
-    if not acc:
-        raise RuntimeError("Este usuario no tiene Strava vinculado.")
 
-    acc = _ensure_valid_token(acc)
+def _ensure_valid_token(acc: IntegrationAccount, margin: int = 60) -> IntegrationAccount:
+    return _refresh_if_needed(acc, margin)[0]
 
+
+# cuentas cuyo refresh proactivo falló: {account_id: (fallos seguidos, próximo intento monotonic)}
+_REFRESH_FAILURES: Dict[int, Tuple[int, float]] = {}
+REFRESH_BACKOFF_CAP = 6 * 3600.0
+
+
+def refresh_expiring_tokens(ahead: int = STRAVA_REFRESH_AHEAD) -> Dict[str, int]:
+    """
+    Refresco proactivo (lo corre el worker): tokens que vencen dentro de `ahead` segundos.
+    Así los requests web nunca esperan al endpoint de tokens. Una cuenta que falla
+    (ej: revocada) se reintenta con backoff exponencial (60s, 120s, ... hasta 6 h).
+    "refreshed" cuenta solo tokens nuevos pedidos por esta pasada.
+    """
+    limit = int(time.time()) + int(ahead)
+    accounts = IntegrationAccount.query.filter(
+        IntegrationAccount.provider == "strava",
+        IntegrationAccount.refresh_token.isnot(None),
+        db.or_(IntegrationAccount.expires_at.is_(None), IntegrationAccount.expires_at <= limit),
+    ).all()
+
+    out = {"refreshed": 0, "failed": 0, "skipped": 0}
+    now = time.monotonic()
+    for acc in accounts:
+        fails, next_try = _REFRESH_FAILURES.get(acc.id, (0, 0.0))
+        if now < next_try:
+            out["skipped"] += 1
+            continue
+        try:
+            refreshed = _refresh_if_needed(acc, margin=ahead)[1]
+            _REFRESH_FAILURES.pop(acc.id, None)
+            out["refreshed"] += 1 if refreshed else 0
+        except Exception as e:
+            db.session.rollback()
+            out["failed"] += 1
+            _REFRESH_FAILURES[acc.id] = (fails + 1, now + min(REFRESH_BACKOFF_CAP, 60.0 * 2 ** fails))
+            print(f"⚠️ strava token user {acc.user_id}: {e}")
+    return out
+
+
+def _fetch_activities_page(acc: IntegrationAccount, after: int, before: int, page: int, per_page: int,
+                           limiter=None) -> List[dict]:
     headers = {"Authorization": f"Bearer {acc.access_token}"}
-    params = {"per_page": per_page, "page": 1}
+    params = {"after": after, "before": before, "page": page, "per_page": per_page}
 
-    r = requests.get(STRAVA_ACTIVITIES_URL, headers=headers, params=params, timeout=20)
+    r = http_client.get(
+        f"{strava_api_base()}/athlete/activities",
+        headers=headers, params=params, name="strava.activities", limiter=limiter,
+    )
+    if r.status_code == 429:
+        raise StravaRateLimited(retry_after_seconds(r.headers))
     r.raise_for_status()
-    activities = r.json() or []
+    return r.json() or []
+
 
-    inserted = 0
+# campos que guardamos en columnas: Summary (paginado) y Detailed (webhook) los traen
+# iguales; kudos_count & cía. cambian solos y no deben contar como "editada"
+HASHED_FIELDS = ("name", "start_date", "distance", "moving_time", "elapsed_time")
 
+
+def _payload_hash(a: dict) -> str:
+    stored = {k: a.get(k) for k in HASHED_FIELDS}
+    raw = json.dumps(stored, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def upsert_activities(user_id: int, activities: List[dict]) -> Dict[str, int]:
+    """
+    ✅ Una página = 2 statements: conteo de existentes + INSERT ... ON CONFLICT
+    (uq_external_activity) DO UPDATE ... WHERE payload_hash IS DISTINCT FROM excluded.
+    Solo se reescriben actividades con cambios en los campos guardados (HASHED_FIELDS).
+    NO hace commit.
+    Devuelve {"inserted", "updated", "unchanged"}.
+    """
+    now = datetime.utcnow()
+    rows: Dict[str, Dict[str, Any]] = {}
     for a in activities:
-        activity_id = str(a.get("id"))
+        activity_id = str(a.get("id") or "")
         if not activity_id:
             continue
+        # misma actividad 2 veces en la página => gana la última (ON CONFLICT no admite duplicados)
+        rows[activity_id] = {
+            "user_id": user_id,
+            "provider": "strava",
+            "provider_activity_id": activity_id,
+            "name": a.get("name"),
+            "start_date": _parse_start_date(a.get("start_date")),
+            "distance_m": a.get("distance"),
+            "moving_time_s": a.get("moving_time"),
+            "elapsed_time_s": a.get("elapsed_time"),
+            "raw_json": a,
+            "payload_hash": _payload_hash(a),
+            "created_at": now,
+            "updated_at": now,
+        }
+    if not rows:
+        return {"inserted": 0, "updated": 0, "unchanged": 0}
+
+    existing = db.session.query(db.func.count(ExternalActivity.id)).filter(
+        ExternalActivity.user_id == user_id,
+        ExternalActivity.provider == "strava",
+        ExternalActivity.provider_activity_id.in_(list(rows)),
+    ).scalar() or 0
+
+    stmt = dialect_insert(ExternalActivity).values(list(rows.values()))
+    ex = stmt.excluded
+    conflict = (
+        {"constraint": "uq_external_activity"}
+        if db_dialect() == "postgresql"
+        else {"index_elements": ["user_id", "provider", "provider_activity_id"]}
+    )
+    stmt = stmt.on_conflict_do_update(
+        **conflict,
+        set_={
+            "name": ex.name,
+            "start_date": ex.start_date,
+            "distance_m": ex.distance_m,
+            "moving_time_s": ex.moving_time_s,
+            "elapsed_time_s": ex.elapsed_time_s,
+            "raw_json": ex.raw_json,
+            "payload_hash": ex.payload_hash,
+            "updated_at": ex.updated_at,
+        },
+        where=ExternalActivity.payload_hash.is_distinct_from(ex.payload_hash),
+    ).returning(ExternalActivity.id)
+
+    written = len(db.session.execute(stmt).all())
+    inserted = len(rows) - int(existing)
+    updated = written - inserted
+    return {"inserted": inserted, "updated": updated, "unchanged": int(existing) - updated}
 
-        exists = ExternalActivity.query.filter_by(
-            user_id=user_id,
-            provider="strava",
-            provider_activity_id=activity_id
-        ).first()
-        if exists:
-            continue
 
-        row = ExternalActivity(
-            user_id=user_id,
-            provider="strava",
-            provider_activity_id=activity_id,
-            name=a.get("name"),
-            start_date=_parse_start_date(a.get("start_date")),
-            distance_m=a.get("distance"),
-            moving_time_s=a.get("moving_time"),
-            elapsed_time_s=a.get("elapsed_time"),
-            raw_json=a,
-            created_at=datetime.utcnow(),
-            updated_at=datetime.utcnow(),
+def _new_cursor(acc: IntegrationAccount, full: bool) -> Dict[str, Any]:
+    """
+    Ventana fija (after, before=ahora): las páginas no se corren si el atleta sube
+    algo mientras sincronizamos; lo nuevo entra en la próxima corrida incremental.
+    """
+    full = full or not acc.sync_after
+    return {
+        "mode": "full" if full else "incremental",
+        "after": 0 if full else int(acc.sync_after),
+        "before": int(time.time()),
+        "page": 1,
+        "max_start": int(acc.sync_after or 0),
+        "max_id": acc.sync_last_activity_id,
+    }
+
+
+def sync_activities(user_id: int, full: bool = False, per_page: int = STRAVA_PER_PAGE,
+                    max_pages: Optional[int] = None, limiter=None,
+                    on_page: Optional[Callable[[], None]] = None) -> Dict[str, Any]:
+    """
+    ✅ Sync paginado y reanudable.
+      - full: pagina TODO el historial (primera vez, o forzado).
+      - incremental: solo actividades posteriores al high-water mark (acc.sync_after).
+    Commit por página con el cursor en la cuenta (acc.sync_cursor): si el proceso muere,
+    la próxima llamada sigue desde la página pendiente. max_pages corta la corrida
+    (queda el cursor para continuar). Al terminar avanza sync_after / sync_last_activity_id.
+    limiter (RateBudget del worker): se consulta antes de cada request; 429 => StravaRateLimited.
+    on_page: se llama antes del commit de cada página (el worker renueva el lock del job).
+    """
+    acc = _ensure_valid_token(_get_account(user_id))
+
+    cur = dict(acc.sync_cursor or {})
+    if not cur or (full and cur.get("mode") != "full"):
+        cur = _new_cursor(acc, full)
+        acc.sync_cursor = cur
+        db.session.commit()
+
+    per_page = max(1, min(int(per_page), STRAVA_PER_PAGE))
+    stats: Dict[str, Any] = {
+        "mode": cur["mode"], "pages": 0, "fetched": 0,
+        "inserted": 0, "updated": 0, "unchanged": 0, "done": False,
+    }
+
+    while max_pages is None or stats["pages"] < max_pages:
+        activities = _fetch_activities_page(acc, cur["after"], cur["before"], cur["page"], per_page, limiter)
+        for k, v in upsert_activities(user_id, activities).items():
+            stats[k] += v
+        stats["fetched"] += len(activities)
+        stats["pages"] += 1
+
+        for a in activities:
+            st = _parse_start_date(a.get("start_date"))
+            if st and st.tzinfo and int(st.timestamp()) > cur["max_start"]:
+                cur["max_start"] = int(st.timestamp())
+                cur["max_id"] = str(a.get("id") or "") or None
+
+        if len(activities) < per_page:
+            acc.sync_after = cur["max_start"] or None
+            acc.sync_last_activity_id = cur["max_id"]
+            acc.sync_cursor = None
+            acc.last_sync_at = datetime.utcnow()
+            stats["done"] = True
+        else:
+            cur["page"] += 1
+            acc.sync_cursor = dict(cur)   # dict nuevo => SQLAlchemy detecta el cambio del JSON
+
+        if on_page is not None:
+            on_page()
+        db.session.commit()
+        if stats["done"]:
+            break
+
+    return stats
+
+
+def _get_account(user_id: int) -> IntegrationAccount:
+    acc = IntegrationAccount.query.filter_by(user_id=user_id, provider="strava").first()
+    if not acc:
+        raise RuntimeError("Este usuario no tiene Strava vinculado.")
+    return acc
+
+
+def delete_activity(user_id: int, activity_id: str) -> int:
+    """Borra la actividad importada (evento delete / ya no visible). NO hace commit."""
+    return ExternalActivity.query.filter_by(
+        user_id=user_id, provider="strava", provider_activity_id=str(activity_id),
+    ).delete(synchronize_session=False)
+
+
+def sync_activity(user_id: int, activity_id: str, limiter=None) -> Dict[str, int]:
+    """
+    ✅ Trae UNA actividad (GET /activities/{id}) y la upsertea (evento del webhook).
+    404 / 403 (borrada o pasó a privada) => se borra la local. Hace commit.
+    """
+    acc = _ensure_valid_token(_get_account(user_id))
+
+    r = http_client.get(
+        f"{strava_api_base()}/activities/{activity_id}",
+        headers={"Authorization": f"Bearer {acc.access_token}"},
+        name="strava.activity", limiter=limiter,
+    )
+    if r.status_code == 429:
+        raise StravaRateLimited(retry_after_seconds(r.headers))
+    if r.status_code in (403, 404):
+        deleted = delete_activity(user_id, activity_id)
+        db.session.commit()
+        return {"inserted": 0, "updated": 0, "unchanged": 0, "deleted": deleted}
+    r.raise_for_status()
+
+    stats = upsert_activities(user_id, [r.json() or {}])
+    db.session.commit()
+    return {**stats, "deleted": 0}
+
+
+def confirm_deauthorization(user_id: int, limiter=None) -> bool:
+    """
+    ✅ Evento deauth del webhook (no viene firmado): se confirma con Strava antes de
+    borrar nada. Revocado = refresh rechazado (400/401) o 401 en GET /athlete con un
+    token vigente. Si se confirma: tokens + cursor en NULL y fuera los jobs en cola.
+    Devuelve True si la cuenta quedó desvinculada. Hace commit.
+    """
+    acc = _get_account(user_id)
+    revoked = not acc.refresh_token
+    if not revoked:
+        try:
+            acc = _ensure_valid_token(acc)
+        except requests.HTTPError as e:
+            if e.response is None or e.response.status_code not in (400, 401):
+                raise
+            revoked = True
+
+    if not revoked:
+        r = http_client.get(
+            f"{strava_api_base()}/athlete",
+            headers={"Authorization": f"Bearer {acc.access_token}"},
+            name="strava.athlete", limiter=limiter,
         )
-        db.session.add(row)
-        inserted += 1
+        if r.status_code == 429:
+            raise StravaRateLimited(retry_after_seconds(r.headers))
+        if r.status_code != 401:
+            r.raise_for_status()
+            return False
+        revoked = True
 
+    acc = _get_account(user_id)
+    acc.access_token = None
+    acc.refresh_token = None
+    acc.expires_at = None
+    acc.sync_cursor = None
+    acc.updated_at = datetime.utcnow()
+    SyncJob.query.filter(
+        SyncJob.user_id == user_id,
+        SyncJob.provider == "strava",
+        SyncJob.status == "queued",
+    ).delete(synchronize_session=False)
     db.session.commit()
-    return inserted
+    return True
+
+
+def sync_latest_activities(user_id: int, per_page: int = STRAVA_PER_PAGE) -> int:
+    """Compat: sync incremental completo. Devuelve actividades insertadas."""
+    return sync_activities(user_id, per_page=per_page)["inserted"]
@@ -0,0 +1,410 @@
+# app/integrations/strava_worker.py
+from __future__ import annotations
+
+import os
+import time
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from app.extensions import db
+from app.models_strava import IntegrationAccount, ExternalActivity, SyncJob
+from app.integrations.strava_client import StravaRateLimited
+from app.integrations.strava_sync import (
+    sync_activities, sync_activity, delete_activity, refresh_expiring_tokens,
+    confirm_deauthorization,
+)
+
+# Límites de lectura por defecto de Strava (por app): 100 req / 15 min, 1000 req / día
+STRAVA_RATE_15MIN = int(os.getenv("STRAVA_RATE_15MIN", "100"))
+STRAVA_RATE_DAILY = int(os.getenv("STRAVA_RATE_DAILY", "1000"))
+
+JOB_MAX_ATTEMPTS = 5
+JOB_PAGES_PER_RUN = 5           # páginas por turno: una cuenta con historial largo no acapara el pool
+# Un job cede el turno si el presupuesto no alcanza en JOB_MAX_WAIT (se reagenda con run_after)
+# y renueva locked_at en cada página. Peor caso entre heartbeats: refresh de token + 1 página,
+# cada uno (HTTP_RETRIES + 1) × (JOB_MAX_WAIT + timeout + Retry-After ≤ 30 s) ≈ 15 min.
+JOB_MAX_WAIT = 60.0
+JOB_STALE_AFTER = timedelta(minutes=30)   # > peor caso entre heartbeats: nunca se reclama uno vivo
+PRIORITY_MANUAL = 1_000_000     # pedidos desde la app (botón "Sincronizar") van primero
+TOKEN_REFRESH_EVERY = 60.0      # segundos entre pasadas de refresco proactivo de tokens
+
+
+class RateBudget:
+    """
+    Token bucket doble (ventana de 15 min + diaria), thread-safe y compartido por el pool.
+    Se recalibra con X-RateLimit-Usage / X-RateLimit-Limit; pause() frena todo tras un 429.
+    max_wait: espera máxima por defecto de acquire() (None = sin límite).
+    """
+
+    def __init__(self, per_15min: int = STRAVA_RATE_15MIN, per_day: int = STRAVA_RATE_DAILY,
+                 max_wait: Optional[float] = JOB_MAX_WAIT):
+        now = time.monotonic()
+        self.max_wait = max_wait
+        # [capacidad, tokens, refill por segundo]
+        self._buckets = [
+            [float(per_15min), float(per_15min), per_15min / 900.0],
+            [float(per_day), float(per_day), per_day / 86400.0],
+        ]
+        self._last = now
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        dt = now - self._last
+        self._last = now
+        for b in self._buckets:
+            b[1] = min(b[0], b[1] + dt * b[2])
+
+    def try_acquire(self) -> float:
+        """0 si consumió un token; si no, segundos sugeridos de espera."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if now < self._paused_until:
+                return self._paused_until - now
+            missing = [(1.0 - b[1]) / b[2] for b in self._buckets if b[1] < 1.0]
+            if missing:
+                return max(missing)
+            for b in self._buckets:
+                b[1] -= 1.0
+            return 0.0
+
+    def acquire(self, max_wait: Optional[float] = None) -> None:
+        """
+        Bloquea hasta tener presupuesto. Si la espera supera max_wait (default: self.max_wait)
+        => StravaRateLimited: el job se reagenda en vez de retener su lock durante la pausa.
+        """
+        max_wait = self.max_wait if max_wait is None else max_wait
+        while True:
+            wait_s = self.try_acquire()
+            if wait_s <= 0:
+                return
+            if max_wait is not None and wait_s > max_wait:
+                raise StravaRateLimited(wait_s)
+            time.sleep(min(wait_s, 1.0))
+
+    def observe(self, headers) -> None:
+        """Ajusta tokens a lo que reporta Strava (otros procesos también gastan la cuota)."""
+        try:
+            limits = [int(x) for x in (headers.get("X-RateLimit-Limit") or "").split(",")]
+            usage = [int(x) for x in (headers.get("X-RateLimit-Usage") or "").split(",")]
+        except ValueError:
+            return
+        with self._lock:
+            for b, lim, used in zip(self._buckets, limits, usage):
+                b[0] = float(lim)
+                b[1] = min(b[1], float(max(0, lim - used)))
+
+    def pause(self, seconds: float) -> None:
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + float(seconds))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._refill(time.monotonic())
+            return {
+                "tokens_15min": round(self._buckets[0][1], 1),
+                "tokens_day": round(self._buckets[1][1], 1),
+                "paused_for": max(0.0, round(self._paused_until - time.monotonic(), 1)),
+            }
+
+
+# =============================================================
+# COLA
+# =============================================================
+def enqueue_sync(user_id: int, priority: int = 0, full: bool = False,
+                 run_after: Optional[datetime] = None) -> Optional[SyncJob]:
+    """
+    Encola un sync de actividades. Si ya hay uno pendiente para el atleta no duplica:
+    sube la prioridad (y el modo full) del existente. NO hace commit.
+    """
+    job = SyncJob.query.filter(
+        SyncJob.provider == "strava",
+        SyncJob.kind == "sync",
+        SyncJob.user_id == user_id,
+        SyncJob.status.in_(("queued", "running")),
+    ).first()
+    if job:
+        job.priority = max(job.priority or 0, int(priority))
+        if full and not (job.payload or {}).get("full"):
+            job.payload = {**(job.payload or {}), "full": True}
+        return job
+
+    job = SyncJob(
+        provider="strava",
+        kind="sync",
+        user_id=user_id,
+        payload={"full": bool(full)},
+        priority=int(priority),
+        run_after=run_after or datetime.utcnow(),
+    )
+    db.session.add(job)
+    return job
+
+
+def enqueue_activity_event(user_id: int, activity_id: str, aspect: str) -> SyncJob:
+    """
+    Evento del webhook (create / update / delete de una actividad). Si ya hay uno
+    pendiente para la misma actividad, gana el último aspect. NO hace commit.
+    """
+    activity_id = str(activity_id)
+    pending = SyncJob.query.filter(
+        SyncJob.provider == "strava",
+        SyncJob.kind == "activity",
+        SyncJob.user_id == user_id,
+        SyncJob.status == "queued",
+    ).all()
+    for job in pending:
+        if (job.payload or {}).get("activity_id") == activity_id:
+            job.payload = {"activity_id": activity_id, "aspect": aspect}
+            return job
+
+    job = SyncJob(
+        provider="strava",
+        kind="activity",
+        user_id=user_id,
+        payload={"activity_id": activity_id, "aspect": aspect},
+        priority=PRIORITY_MANUAL,
+        run_after=datetime.utcnow(),
+    )
+    db.session.add(job)
+    return job
+
+
+def enqueue_deauth_check(user_id: int) -> SyncJob:
+    """Evento deauth del webhook: job que lo confirma con Strava antes de borrar tokens. NO hace commit."""
+    job = SyncJob.query.filter(
+        SyncJob.provider == "strava",
+        SyncJob.kind == "deauth",
+        SyncJob.user_id == user_id,
+        SyncJob.status == "queued",
+    ).first()
+    if job:
+        return job
+
+    job = SyncJob(
+        provider="strava",
+        kind="deauth",
+        user_id=user_id,
+        payload={},
+        priority=PRIORITY_MANUAL,
+        run_after=datetime.utcnow(),
+    )
+    db.session.add(job)
+    return job
+
+
+def _run_activity_job(job: SyncJob, limiter: "RateBudget") -> Dict[str, Any]:
+    payload = job.payload or {}
+    activity_id = str(payload.get("activity_id") or "")
+    if not activity_id:
+        raise RuntimeError("job sin activity_id")
+    if payload.get("aspect") == "delete":
+        deleted = delete_activity(job.user_id, activity_id)
+        db.session.commit()
+        return {"deleted": deleted, "done": True}
+    return {**sync_activity(job.user_id, activity_id, limiter=limiter), "done": True}
+
+
+def _recency_priorities(user_ids: List[int]) -> Dict[int, int]:
+    """Prioridad = horas epoch de la última actividad importada (más reciente => antes)."""
+    if not user_ids:
+        return {}
+    rows = (
+        db.session.query(ExternalActivity.user_id, db.func.max(ExternalActivity.start_date))
+        .filter(ExternalActivity.user_id.in_(user_ids), ExternalActivity.provider == "strava")
+        .group_by(ExternalActivity.user_id)
+        .all()
+    )
+    out: Dict[int, int] = {}
+    for uid, last in rows:
+        if isinstance(last, str):
+            last = datetime.fromisoformat(last[:19])
+        out[int(uid)] = int(last.replace(tzinfo=None).timestamp() // 3600) if last else 0
+    return out
+
+
+def enqueue_all_accounts() -> int:
+    """Un sync incremental por cuenta vinculada, priorizado por actividad reciente. NO hace commit."""
+    user_ids = [
+        uid for (uid,) in db.session.query(IntegrationAccount.user_id).filter(
+            IntegrationAccount.provider == "strava",
+            IntegrationAccount.refresh_token.isnot(None),
+        ).all()
+    ]
+    prio = _recency_priorities(user_ids)
+    for uid in user_ids:
+        enqueue_sync(uid, priority=prio.get(uid, 0))
+    return len(user_ids)
+
+
+def claim_jobs(limit: int, worker_id: str) -> List[int]:
+    """
+    Toma hasta `limit` jobs listos (FOR UPDATE SKIP LOCKED en Postgres: varios workers
+    no se pisan). Devuelve ids ya marcados running. Hace commit.
+    """
+    if limit <= 0:
+        return []
+    now = datetime.utcnow()
+
+    # jobs de un worker que murió a mitad => de vuelta a la cola
+    SyncJob.query.filter(
+        SyncJob.status == "running",
+        SyncJob.locked_at < now - JOB_STALE_AFTER,
+    ).update({SyncJob.status: "queued", SyncJob.locked_by: None}, synchronize_session=False)
+
+    jobs = (
+        SyncJob.query.filter(SyncJob.status == "queued", SyncJob.run_after <= now)
+        .order_by(SyncJob.priority.desc(), SyncJob.run_after.asc(), SyncJob.id.asc())
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+    for job in jobs:
+        job.status = "running"
+        job.locked_by = worker_id
+        job.locked_at = now
+        job.attempts = (job.attempts or 0) + 1
+    ids = [job.id for job in jobs]
+    db.session.commit()
+    return ids
+
+
+def _retry_delay(attempts: int) -> timedelta:
+    return timedelta(seconds=min(3600, 30 * 2 ** max(0, attempts - 1)))
+
+
+def _heartbeat(job_id: int) -> None:
+    """Renueva el lock del job (lo commitea el caller junto con su página)."""
+    SyncJob.query.filter_by(id=job_id, status="running").update(
+        {SyncJob.locked_at: datetime.utcnow()}, synchronize_session=False,
+    )
+
+
+def run_job(job_id: int, limiter: RateBudget) -> str:
+    """Ejecuta un job (en un thread con app context). Devuelve el status final."""
+    job = db.session.get(SyncJob, job_id)
+    if not job or job.status != "running":
+        return "skipped"
+
+    try:
+        if job.kind == "activity":
+            stats = _run_activity_job(job, limiter)
+        elif job.kind == "deauth":
+            stats = {"deauthorized": confirm_deauthorization(job.user_id, limiter=limiter), "done": True}
+        elif job.kind == "sync":
+            stats = sync_activities(
+                job.user_id,
+                full=bool((job.payload or {}).get("full")),
+                max_pages=JOB_PAGES_PER_RUN,
+                limiter=limiter,
+                on_page=lambda: _heartbeat(job_id),
+            )
+        else:
+            raise RuntimeError(f"kind desconocido: {job.kind}")
+        job = db.session.get(SyncJob, job_id)
+        job.result = stats
+        job.last_error = None
+        if stats.get("done"):
+            job.status = "done"
+        else:
+            # quedan páginas: vuelve a la cola (el cursor está en la cuenta) y cede el turno
+            job.status = "queued"
+            job.attempts = 0
+            job.payload = {**(job.payload or {}), "full": False}
+            job.run_after = datetime.utcnow()
+    except StravaRateLimited as e:
+        db.session.rollback()
+        limiter.pause(e.retry_after)
+        job = db.session.get(SyncJob, job_id)
+        job.status = "queued"
+        job.attempts = max(0, (job.attempts or 1) - 1)   # un 429 no es culpa del job
+        job.run_after = datetime.utcnow() + timedelta(seconds=e.retry_after)
+        job.last_error = str(e)
+    except Exception as e:
+        db.session.rollback()
+        job = db.session.get(SyncJob, job_id)
+        job.last_error = f"{type(e).__name__}: {e}"[:2000]
+        if (job.attempts or 0) >= JOB_MAX_ATTEMPTS:
+            job.status = "failed"
+        else:
+            job.status = "queued"
+            job.run_after = datetime.utcnow() + _retry_delay(job.attempts or 1)
+
+    job.locked_by = None
+    job.locked_at = None
+    db.session.commit()
+    return job.status
+
+
+def run_worker(app, concurrency: int = 4, once: bool = False, poll_seconds: float = 5.0,
+               schedule_every: Optional[float] = 900.0, limiter: Optional[RateBudget] = None,
+               log=print) -> Dict[str, int]:
+    """
+    ✅ Loop del worker: pool de `concurrency` threads, cada job en su propio app context.
+    schedule_every: cada cuántos segundos encola un sync incremental de todas las cuentas
+    (None = no agenda; solo consume la cola). once=True: corre los jobs listos y termina
+    (los reagendados a futuro quedan en la cola).
+    Cada TOKEN_REFRESH_EVERY refresca los tokens que están por vencer (refresh_expiring_tokens).
+    """
+    limiter = limiter or RateBudget()
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    counts: Dict[str, int] = {}
+    next_schedule = 0.0
+    next_token_refresh = 0.0
+
+    def _job(job_id: int) -> str:
+        with app.app_context():
+            try:
+                return run_job(job_id, limiter)
+            finally:
+                db.session.remove()
+
+    running = set()
+    with ThreadPoolExecutor(max_workers=max(1, int(concurrency))) as pool:
+        while True:
+            with app.app_context():
+                if schedule_every and time.monotonic() >= next_schedule:
+                    n = enqueue_all_accounts()
+                    db.session.commit()
+                    next_schedule = time.monotonic() + schedule_every
+                    log(f"🗓️ encolados {n} syncs")
+
+                if time.monotonic() >= next_token_refresh:
+                    res = refresh_expiring_tokens()
+                    next_token_refresh = time.monotonic() + TOKEN_REFRESH_EVERY
+                    if res["refreshed"] or res["failed"]:
+                        log(f"🔑 tokens: {res}")
+
+                for job_id in claim_jobs(concurrency - len(running), worker_id):
+                    running.add(pool.submit(_job, job_id))
+
+                pending = 0
+                if once and not running:
+                    # los reagendados a futuro (429 / backoff) no cuentan: --once no los espera
+                    pending = SyncJob.query.filter(
+                        SyncJob.status == "queued",
+                        SyncJob.run_after <= datetime.utcnow(),
+                    ).count()
+                db.session.remove()
+
+            if once and not running and not pending:
+                break
+
+            if running:
+                done, _ = wait(running, timeout=poll_seconds, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    running.discard(fut)
+                    try:
+                        status = fut.result()
+                    except Exception as e:   # no debería: run_job captura todo
+                        status = "crashed"
+                        log(f"❌ job: {e}")
+                    counts[status] = counts.get(status, 0) + 1
+            else:
+                time.sleep(poll_seconds if not once else min(poll_seconds, 0.5))
+
+    return counts
@@ -24,6 +24,12 @@ class User(UserMixin, db.Model):
 
     fecha_creacion = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
 
+    # ✅ keyset del tablero de equipo: ORDER BY nombre, id (con o sin filtro de grupo)
+    __table_args__ = (
+        db.Index("ix_users_nombre_id", "nombre", "id"),
+        db.Index("ix_users_grupo_nombre_id", "grupo", "nombre", "id"),
+    )
+
     def set_password(self, password: str) -> None:
         self.password_hash = generate_password_hash(password)
 
@@ -57,6 +63,9 @@ class DiaPlan(db.Model):
     # Por eso: deferred + nullable + sin default.
     blocks = deferred(db.Column(JSONB, nullable=True))
 
+    # ✅ versión de fila (ETag de /api/day_detail). Nullable: filas legacy.
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=True)
+
     user = db.relationship("User", backref=db.backref("planes", lazy=True))
 
     __table_args__ = (
@@ -77,6 +86,10 @@ class Rutina(db.Model):
     # ✅ Igual: si no existe aún en DB, al ser nullable y sin default, no molesta.
     tabata_preset = db.Column(JSONB, nullable=True)
 
+    # ✅ Se incrementa en cada edición (items / tabata): invalida la caché de items
+    # y los ETags de los días que la referencian.
+    version = db.Column(db.Integer, default=1, server_default="1", nullable=False)
+
     items = db.relationship(
         "RutinaItem",
         backref="rutina",
@@ -95,6 +108,17 @@ class Ejercicio(db.Model):
 
     video_filename = db.Column(db.String(255), default="", nullable=False)
 
+    # ✅ grupo muscular precalculado desde categoria (al crear / `flask vir backfill-muscle-groups`)
+    grupo_muscular = db.Column(db.String(40), nullable=True)
+
+    # ✅ nombre + categoria + descripcion normalizados (sin tildes) para /api/ejercicios/search.
+    # Índice: pg_trgm GIN en Postgres / FTS5 en SQLite (ver app/search.py)
+    search_text = deferred(db.Column(db.Text, nullable=True))
+
+    __table_args__ = (
+        db.Index("ix_ejercicios_grupo_nombre", "grupo_muscular", "nombre"),
+    )
+
 
 class RutinaItem(db.Model):
     __tablename__ = "rutina_items"
@@ -156,6 +180,62 @@ class AthleteCheck(db.Model):
     )
 
 
+class AthleteStreak(db.Model):
+    """
+    Racha materializada (opcional). current_streak = largo de la racha que termina
+    en last_train_date. La mantiene athlete_save_log; `flask vir backfill-streaks` la rearma.
+    """
+    __tablename__ = "athlete_streaks"
+
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+
+    current_streak = db.Column(db.Integer, default=0, nullable=False)
+    longest_streak = db.Column(db.Integer, default=0, nullable=False)
+    last_train_date = db.Column(db.Date, nullable=True)
+
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+
+class AthleteDayStat(db.Model):
+    """
+    Rollup diario de cumplimiento (1 fila por atleta+día con algo: plan, log o checks).
+    Lo mantienen los endpoints de escritura (refresh_day_stats del día/rango tocado);
+    `flask vir rebuild-adherence` lo rearma. Días sin fila = descanso sin registro.
+    """
+    __tablename__ = "athlete_day_stats"
+
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    fecha = db.Column(db.Date, primary_key=True)
+
+    plan_type = db.Column(db.String(40), default="Descanso", nullable=False)
+    planned = db.Column(db.Boolean, default=False, nullable=False)      # plan_type != Descanso
+    available = db.Column(db.Boolean, default=True, nullable=False)     # puede_entrenar != 'no'
+    did_train = db.Column(db.Boolean, default=False, nullable=False)
+
+    checks_done = db.Column(db.Integer, default=0, nullable=False)
+    checks_total = db.Column(db.Integer, default=0, nullable=False)
+    # {"<rutina_id>": [done, total]}
+    checks_by_rutina = db.Column(JSONB, nullable=True)
+
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        db.Index("ix_athlete_day_stats_fecha", "fecha"),
+    )
+
+
+class CacheVersion(db.Model):
+    """
+    Versión por nombre de cache en memoria (ej: catálogo de ejercicios).
+    Cada worker compara su copia contra esta fila: un UPDATE invalida en todos.
+    """
+    __tablename__ = "cache_versions"
+
+    name = db.Column(db.String(60), primary_key=True)
+    version = db.Column(db.Integer, default=1, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+
 class IntegrationAccount(db.Model):
     __tablename__ = "integration_accounts"
 
@@ -169,8 +249,17 @@ class IntegrationAccount(db.Model):
 
     external_user_id = db.Column(db.String(80), nullable=True)
 
+    # ✅ Sync incremental: high-water mark (start_date epoch + id de la última actividad importada)
+    sync_after = db.Column(db.Integer, nullable=True)
+    sync_last_activity_id = db.Column(db.String(80), nullable=True)
+    # Corrida en curso (reanudable tras un crash): {"mode", "after", "before", "page", "max_start", "max_id"}
+    sync_cursor = db.Column(db.JSON, nullable=True)
+    last_sync_at = db.Column(db.DateTime, nullable=True)
+
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
 
     __table_args__ = (
         db.UniqueConstraint("user_id", "provider", name="uq_integration_accounts_user_provider"),
+        # webhook de Strava: owner_id => cuenta
+        db.Index("ix_integration_accounts_provider_external", "provider", "external_user_id"),
     )
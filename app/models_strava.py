@@ -4,27 +4,9 @@ from __future__ import annotations
 from datetime import datetime
 from app.extensions import db
 
-
-class IntegrationAccount(db.Model):
-    __tablename__ = "integration_accounts"
-
-    id = db.Column(db.Integer, primary_key=True)
-
-    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False, index=True)
-
-    provider = db.Column(db.String(50), nullable=False, index=True)  # "strava"
-    external_user_id = db.Column(db.String(80), nullable=True, index=True)
-
-    access_token = db.Column(db.Text, nullable=False)
-    refresh_token = db.Column(db.Text, nullable=True)
-    expires_at = db.Column(db.Integer, nullable=True)  # epoch seconds
-
-    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
-
-    __table_args__ = (
-        db.UniqueConstraint("user_id", "provider", name="uq_integration_user_provider"),
-    )
+# ✅ IntegrationAccount vive en app.models (misma tabla "integration_accounts").
+# Redefinirla acá rompía el import ("Table already defined"); se re-exporta.
+from app.models import IntegrationAccount  # noqa: F401
 
 
 class ExternalActivity(db.Model):
@@ -45,10 +27,49 @@ class ExternalActivity(db.Model):
     elapsed_time_s = db.Column(db.Integer, nullable=True)
 
     raw_json = db.Column(db.JSON, nullable=True)
+    # sha256 del payload de Strava: el upsert solo reescribe filas cuyo payload cambió
+    payload_hash = db.Column(db.String(64), nullable=True)
 
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     __table_args__ = (
         db.UniqueConstraint("user_id", "provider", "provider_activity_id", name="uq_external_activity"),
+        # calendario: "¿hubo actividad este día?" por rango de fechas
+        db.Index("ix_external_activities_user_start", "user_id", "start_date"),
+    )
+
+
+class SyncJob(db.Model):
+    """
+    Cola de trabajos en DB (la consume `flask vir strava-worker`).
+    kind: "sync" (actividades de un atleta) / "activity" (1 actividad, evento del webhook) /
+          "deauth" (confirmar con Strava una desautorización del webhook).
+    status: queued / running / done / failed.
+    Mayor priority = antes (atletas con actividad reciente / pedidos manuales).
+    """
+    __tablename__ = "sync_jobs"
+
+    id = db.Column(db.Integer, primary_key=True)
+    provider = db.Column(db.String(40), nullable=False, default="strava")
+    kind = db.Column(db.String(40), nullable=False, default="sync")
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id", ondelete="CASCADE"), nullable=True, index=True)
+    payload = db.Column(db.JSON, nullable=True)
+
+    status = db.Column(db.String(20), nullable=False, default="queued")
+    priority = db.Column(db.Integer, nullable=False, default=0)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    run_after = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    locked_by = db.Column(db.String(80), nullable=True)
+    locked_at = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    result = db.Column(db.JSON, nullable=True)
+
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        # claim: WHERE status='queued' AND run_after <= now ORDER BY priority DESC
+        db.Index("ix_sync_jobs_claim", "status", "run_after", "priority"),
     )
@@ -2,27 +2,36 @@
 from __future__ import annotations
 
 import os
+import json
+import base64
+import hashlib
 from datetime import date, datetime, timedelta
 from calendar import monthrange
 from typing import List, Dict, Any, Optional
 from urllib.parse import urlencode
 
-import requests
 from werkzeug.utils import secure_filename
 
 from flask import (
     Blueprint, render_template, redirect, url_for,
-    flash, request, jsonify, current_app
+    flash, request, jsonify, current_app, session, make_response
 )
 from flask_login import login_user, logout_user, login_required, current_user
-from sqlalchemy import text
-from sqlalchemy.orm import load_only
+from sqlalchemy import text, func, bindparam, or_, and_, case, cast, literal, tuple_
+from sqlalchemy.orm import load_only, joinedload, undefer
 
 from app.extensions import db
+from app.db_utils import db_dialect, dialect_insert
+from app.rutina_cache import rutina_cache
+from app.catalog_cache import catalog_cache
+from app.search import ejercicio_search_text, search_ejercicio_ids
 from app.models import (
     User, DiaPlan, Rutina, Ejercicio, RutinaItem,
-    AthleteLog, AthleteCheck, IntegrationAccount
+    AthleteLog, AthleteCheck, IntegrationAccount, AthleteStreak, CacheVersion, AthleteDayStat
 )
+from app.models_strava import ExternalActivity  # noqa: F401  (registra la tabla)
+from app.integrations.strava_client import exchange_code_for_token
+from app.integrations.http_client import http_metrics
 
 # =============================================================
 # BLUEPRINT (UNO SOLO)
@@ -122,8 +131,20 @@ def videos_dir() -> str:
     return folder
 
 
+# cache por proceso del listado de /static/videos (se invalida por mtime de la carpeta)
+_VIDEOS_CACHE: Dict[str, Any] = {"key": None, "names": []}
+
+
 def list_repo_videos() -> List[str]:
     folder = videos_dir()
+    try:
+        st = os.stat(folder)
+        key = (folder, st.st_mtime_ns)
+    except OSError:
+        key = None
+    if key is not None and _VIDEOS_CACHE["key"] == key:
+        return list(_VIDEOS_CACHE["names"])
+
     out: List[str] = []
     try:
         for name in os.listdir(folder):
@@ -136,7 +157,9 @@ def list_repo_videos() -> List[str]:
     except FileNotFoundError:
         pass
     out.sort()
-    return out
+    _VIDEOS_CACHE["key"] = key
+    _VIDEOS_CACHE["names"] = out
+    return list(out)
 
 
 def save_video_to_static(file_storage) -> str:
@@ -242,18 +265,129 @@ def get_strava_account(user_id: int):
         return None
 
 
+def _as_date(v) -> Optional[date]:
+    if v is None or isinstance(v, date):
+        return v
+    return date.fromisoformat(str(v)[:10])
+
+
+def streak_islands(user_id: Optional[int] = None, until: Optional[date] = None) -> Dict[int, Dict[str, Any]]:
+    """
+    ✅ Gaps-and-islands en UNA query (window functions; Postgres y SQLite >= 3.25).
+    fecha - ROW_NUMBER() es constante dentro de cada racha de días consecutivos.
+    Devuelve {user_id: {"current": largo de la última racha, "last_day": fin de esa racha,
+                        "longest": racha más larga}}.
+    """
+    if db_dialect() == "postgresql":
+        grp = "fecha - CAST(ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY fecha) AS INTEGER)"
+    else:
+        grp = "julianday(fecha) - ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY fecha)"
+
+    where = ["did_train"]
+    params: Dict[str, Any] = {}
+    if user_id is not None:
+        where.append("user_id = :uid")
+        params["uid"] = user_id
+    if until is not None:
+        where.append("fecha <= :until")
+        params["until"] = until
+
+    sql = f"""
+        WITH t AS (
+            SELECT user_id, fecha, {grp} AS grp
+            FROM athlete_logs
+            WHERE {" AND ".join(where)}
+        ),
+        islands AS (
+            SELECT user_id, grp, COUNT(*) AS len, MAX(fecha) AS last_day
+            FROM t
+            GROUP BY user_id, grp
+        ),
+        ranked AS (
+            SELECT user_id, len, last_day,
+                   MAX(len) OVER (PARTITION BY user_id) AS longest,
+                   ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY last_day DESC) AS rn
+            FROM islands
+        )
+        SELECT user_id, len, last_day, longest FROM ranked WHERE rn = 1
+    """
+    out: Dict[int, Dict[str, Any]] = {}
+    for uid, length, last_day, longest in db.session.execute(text(sql), params):
+        out[int(uid)] = {"current": int(length), "last_day": _as_date(last_day), "longest": int(longest)}
+    return out
+
+
+def store_streak(user_id: int, isl: Optional[Dict[str, Any]]) -> AthleteStreak:
+    st = db.session.get(AthleteStreak, user_id)
+    if not st:
+        st = AthleteStreak(user_id=user_id)
+        db.session.add(st)
+    st.current_streak = isl["current"] if isl else 0
+    st.longest_streak = isl["longest"] if isl else 0
+    st.last_train_date = isl["last_day"] if isl else None
+    return st
+
+
+def update_streak_on_log(user_id: int, fecha: date, did_train: bool) -> None:
+    """
+    Incremental (lo llama athlete_save_log antes del commit):
+    - día siguiente a la última racha => +1 sin queries extra
+    - mismo día ya contado => nada
+    - cualquier otro caso (editar pasado, desmarcar) => recalcula con streak_islands
+    """
+    st = db.session.get(AthleteStreak, user_id)
+    last = st.last_train_date if st else None
+
+    if st and did_train and last:
+        if fecha == last:
+            return
+        if fecha == last + timedelta(days=1):
+            st.current_streak = (st.current_streak or 0) + 1
+            st.longest_streak = max(st.longest_streak or 0, st.current_streak)
+            st.last_train_date = fecha
+            return
+
+    db.session.flush()
+    store_streak(user_id, streak_islands(user_id=user_id).get(user_id))
+
+
 def compute_streak(user_id: int, today: date) -> int:
     """Streak real: días consecutivos did_train=True hacia atrás desde hoy."""
-    streak = 0
-    cur = today
-    while True:
-        lg = AthleteLog.query.filter_by(user_id=user_id, fecha=cur).first()
-        if lg and bool(getattr(lg, "did_train", False)):
-            streak += 1
-            cur = cur - timedelta(days=1)
-        else:
-            break
-    return streak
+    st = db.session.get(AthleteStreak, user_id)
+    if st and (st.last_train_date is None or st.last_train_date <= today):
+        return int(st.current_streak or 0) if st.last_train_date == today else 0
+
+    isl = streak_islands(user_id=user_id, until=today).get(user_id)
+    if isl and isl["last_day"] == today:
+        return isl["current"]
+    return 0
+
+
+# =============================================================
+# ✅ ETAG / 304 (lecturas del atleta)
+# =============================================================
+# Bump si cambia el shape de las respuestas cacheadas por ETag.
+ETAG_PAYLOAD_VERSION = 1
+
+
+def _etag_for(*parts) -> str:
+    raw = "|".join(repr(p) for p in (ETAG_PAYLOAD_VERSION,) + parts)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def _client_has_etag(etag: str) -> bool:
+    return request.if_none_match.contains(etag)
+
+
+def _with_etag(resp, etag: str):
+    resp.set_etag(etag)
+    # privado (depende del usuario) y siempre revalidar
+    resp.headers["Cache-Control"] = "private, no-cache"
+    return resp
+
+
+def _not_modified(etag: str):
+    return _with_etag(current_app.response_class(status=304), etag)
 
 
 # =============================================================
@@ -323,40 +457,72 @@ def _rutina_payload(rutina: Rutina) -> Dict[str, Any]:
     return {"id": rutina.id, "nombre": rutina.nombre, "tipo": getattr(rutina, "tipo", "")}
 
 
-def _items_payload_for_rutina(rutina_id: int) -> List[Dict[str, Any]]:
-    ritems = (
-        RutinaItem.query
-        .filter_by(rutina_id=rutina_id)
-        .order_by(RutinaItem.posicion.asc(), RutinaItem.id.asc())
-        .all()
-    )
+def _item_payload(it: RutinaItem) -> Dict[str, Any]:
+    video_src = ""
 
-    items_payload: List[Dict[str, Any]] = []
-    for it in ritems:
-        video_src = ""
+    if getattr(it, "video_url", None):
+        v = (it.video_url or "").strip()
+        if v.startswith("http://") or v.startswith("https://"):
+            video_src = v
+        else:
+            v = v.lstrip("/").replace("\\", "/")
+            video_src = url_for("static", filename=v)
+    elif getattr(it, "ejercicio", None) and getattr(it.ejercicio, "video_filename", None):
+        if it.ejercicio.video_filename:
+            video_src = url_for("static", filename=f"videos/{it.ejercicio.video_filename}")
+
+    return {
+        "id": it.id,
+        "nombre": it.nombre,
+        "series": getattr(it, "series", None),
+        "reps": getattr(it, "reps", None),
+        "peso": getattr(it, "peso", None),
+        "descanso": getattr(it, "descanso", None),
+        "nota": getattr(it, "nota", "") or "",
+        "video_src": video_src,
+    }
 
-        if getattr(it, "video_url", None):
-            v = (it.video_url or "").strip()
-            if v.startswith("http://") or v.startswith("https://"):
-                video_src = v
-            else:
-                v = v.lstrip("/").replace("\\", "/")
-                video_src = url_for("static", filename=v)
-        elif getattr(it, "ejercicio", None) and getattr(it.ejercicio, "video_filename", None):
-            if it.ejercicio.video_filename:
-                video_src = url_for("static", filename=f"videos/{it.ejercicio.video_filename}")
-
-        items_payload.append({
-            "id": it.id,
-            "nombre": it.nombre,
-            "series": getattr(it, "series", None),
-            "reps": getattr(it, "reps", None),
-            "peso": getattr(it, "peso", None),
-            "descanso": getattr(it, "descanso", None),
-            "nota": getattr(it, "nota", "") or "",
-            "video_src": video_src,
-        })
-    return items_payload
+
+def _rutina_payloads(rutinas: List[Rutina]) -> Dict[int, Dict[str, Any]]:
+    """
+    ✅ {rutina_id: {"items": [...], "tabata_cfg": {...}}} usando rutina_cache.
+    La versión viene de la fila Rutina recién leída de la DB (seguro con varios workers).
+    Solo las rutinas que no están en cache cuestan 1 query (items + ejercicio JOIN).
+    """
+    out: Dict[int, Dict[str, Any]] = {}
+    missing: Dict[int, Rutina] = {}
+    for r in rutinas:
+        cached = rutina_cache.get(r.id, r.version)
+        if cached is not None:
+            out[r.id] = cached
+        else:
+            missing[r.id] = r
+
+    if missing:
+        ritems = (
+            RutinaItem.query
+            .options(joinedload(RutinaItem.ejercicio))
+            .filter(RutinaItem.rutina_id.in_(list(missing.keys())))
+            .order_by(RutinaItem.rutina_id.asc(), RutinaItem.posicion.asc(), RutinaItem.id.asc())
+            .all()
+        )
+        items: Dict[int, List[Dict[str, Any]]] = {rid: [] for rid in missing}
+        for it in ritems:
+            items[it.rutina_id].append(_item_payload(it))
+
+        for rid, r in missing.items():
+            payload = {"items": items[rid], "tabata_cfg": _get_tabata_cfg(r, len(items[rid]))}
+            rutina_cache.put(rid, r.version, payload)
+            out[rid] = payload
+
+    return out
+
+
+def _items_payload_for_rutina(rutina_id: int) -> List[Dict[str, Any]]:
+    rutina = Rutina.query.get(rutina_id)
+    if not rutina:
+        return []
+    return _rutina_payloads([rutina])[rutina.id]["items"]
 
 
 # =============================================================
@@ -386,17 +552,61 @@ def _get_tabata_cfg(rutina: Rutina, items_count: int) -> Dict[str, Any]:
 
 def _save_tabata_cfg(rutina: Rutina, cfg: Dict[str, Any]) -> None:
     rutina.tabata_preset = cfg
+    rutina.version = (rutina.version or 0) + 1
     db.session.commit()
 
 
-def _build_blocks_payload_from_text(text_src: str) -> List[Dict[str, Any]]:
+def _block_ref_id(b: Dict[str, Any]) -> Optional[int]:
+    """id de rutina (tabata/fuerza/stretch) o de ejercicio (ejercicio) que referencia el bloque."""
+    if "ref" in b:
+        # bloque compilado (DiaPlan.blocks): ya viene resuelto
+        return b["ref"]
+    raw = (b.get("raw") or "").strip()
+    if b["type"] in ("tabata", "fuerza", "stretch"):
+        return parse_rutina_ref(raw)
+    if b["type"] == "ejercicio":
+        return parse_ejercicio_ref(raw)
+    return None
+
+
+def _load_blocks_refs(rutina_ids, ejercicio_ids) -> Dict[str, Dict[int, Any]]:
+    """
+    ✅ Carga en lote todo lo que referencian los bloques (cantidad fija de queries):
+      1) rutinas
+      2) items ordenados + ejercicio (JOIN) — solo rutinas que no están en rutina_cache
+      3) ejercicios sueltos (EJ:123)
+    """
+    rutina_ids = sorted({int(x) for x in rutina_ids if x})
+    ejercicio_ids = sorted({int(x) for x in ejercicio_ids if x})
+
+    rutinas: Dict[int, Rutina] = {}
+    payloads: Dict[int, Dict[str, Any]] = {}
+    ejercicios: Dict[int, Ejercicio] = {}
+
+    if rutina_ids:
+        rutinas = {r.id: r for r in Rutina.query.filter(Rutina.id.in_(rutina_ids)).all()}
+
+    if rutinas:
+        payloads = _rutina_payloads(list(rutinas.values()))
+
+    if ejercicio_ids:
+        ejercicios = {e.id: e for e in Ejercicio.query.filter(Ejercicio.id.in_(ejercicio_ids)).all()}
+
+    return {
+        "rutinas": rutinas,
+        "items": {rid: p["items"] for rid, p in payloads.items()},
+        "tabata_cfg": {rid: p["tabata_cfg"] for rid, p in payloads.items()},
+        "ejercicios": ejercicios,
+    }
+
+
+def _resolve_blocks(blocks_src: List[Dict[str, str]], refs: Dict[str, Dict[int, Any]]) -> List[Dict[str, Any]]:
     """
-    🔥 Devuelve bloques ENRIQUECIDOS listos para UI:
+    🔥 Devuelve bloques ENRIQUECIDOS listos para UI (sin queries: usa refs precargadas):
     - tabata/fuerza/stretch => rutina + items
     - ejercicio => ejercicio + video_url
     - run/bike/swim/free/note => text
     """
-    blocks_src = _split_blocks_from_text(text_src or "")
     blocks: List[Dict[str, Any]] = []
 
     for b in blocks_src:
@@ -404,19 +614,14 @@ def _build_blocks_payload_from_text(text_src: str) -> List[Dict[str, Any]]:
         raw = (b["raw"] or "").strip()
 
         if btype == "tabata":
-            rid = None
-            if raw.upper().startswith("RUTINA:"):
-                rid = parse_rutina_ref(raw)
-            if not rid:
-                rid = parse_rutina_ref(raw)
-
-            rutina = Rutina.query.get(rid) if rid else None
+            rid = _block_ref_id(b)
+            rutina = refs["rutinas"].get(rid) if rid else None
             if not rutina:
                 blocks.append({"type": "tabata", "ok": False, "error": "Rutina no encontrada"})
                 continue
 
-            items = _items_payload_for_rutina(rutina.id)
-            cfg = _get_tabata_cfg(rutina, len(items))
+            items = refs["items"].get(rutina.id, [])
+            cfg = refs["tabata_cfg"].get(rutina.id) or _get_tabata_cfg(rutina, len(items))
 
             blocks.append({
                 "type": "tabata",
@@ -430,13 +635,13 @@ def _build_blocks_payload_from_text(text_src: str) -> List[Dict[str, Any]]:
             continue
 
         if btype in ("fuerza", "stretch"):
-            rid = parse_rutina_ref(raw)
-            rutina = Rutina.query.get(rid) if rid else None
+            rid = _block_ref_id(b)
+            rutina = refs["rutinas"].get(rid) if rid else None
             if not rutina:
                 blocks.append({"type": btype, "ok": False, "error": "Rutina no encontrada"})
                 continue
 
-            items = _items_payload_for_rutina(rutina.id)
+            items = refs["items"].get(rutina.id, [])
             blocks.append({
                 "type": btype,
                 "ok": True,
@@ -447,8 +652,8 @@ def _build_blocks_payload_from_text(text_src: str) -> List[Dict[str, Any]]:
             continue
 
         if btype == "ejercicio":
-            eid = parse_ejercicio_ref(raw)
-            ej = Ejercicio.query.get(eid) if eid else None
+            eid = _block_ref_id(b)
+            ej = refs["ejercicios"].get(eid) if eid else None
             if not ej:
                 blocks.append({"type": "ejercicio", "ok": False, "error": "Ejercicio no encontrado"})
                 continue
@@ -479,6 +684,136 @@ def _build_blocks_payload_from_text(text_src: str) -> List[Dict[str, Any]]:
     return blocks
 
 
+def _collect_block_refs(parsed: Dict[Any, List[Dict[str, Any]]]):
+    rutina_ids: set = set()
+    ejercicio_ids: set = set()
+    for blocks_src in parsed.values():
+        for b in blocks_src:
+            ref = _block_ref_id(b)
+            if not ref:
+                continue
+            if b["type"] == "ejercicio":
+                ejercicio_ids.add(ref)
+            else:
+                rutina_ids.add(ref)
+    return rutina_ids, ejercicio_ids
+
+
+def _resolve_sections(parsed: Dict[Any, List[Dict[str, Any]]]):
+    """Resuelve secciones ya parseadas. Devuelve (payload por sección, refs cargadas)."""
+    rutina_ids, ejercicio_ids = _collect_block_refs(parsed)
+    refs = _load_blocks_refs(rutina_ids, ejercicio_ids)
+    return {key: _resolve_blocks(blocks_src, refs) for key, blocks_src in parsed.items()}, refs
+
+
+def _build_sections_payload(sections: Dict[Any, str]) -> Dict[Any, List[Dict[str, Any]]]:
+    """
+    ✅ Resolver en lote: parsea TODAS las secciones primero (warmup/main/finisher,
+    o varios días), junta los ids referenciados y resuelve todo con _load_blocks_refs.
+    """
+    parsed = {key: _split_blocks_from_text(txt or "") for key, txt in sections.items()}
+    return _resolve_sections(parsed)[0]
+
+
+def _build_blocks_payload_from_text(text_src: str) -> List[Dict[str, Any]]:
+    return _build_sections_payload({"text": text_src or ""})["text"]
+
+
+# =============================================================
+# ✅ BLOQUES COMPILADOS (DiaPlan.blocks)
+# =============================================================
+# Formato guardado en DiaPlan.blocks:
+#   {"v": PLAN_BLOCKS_FORMAT,
+#    "sections": {"warmup": [...], "main": [...], "finisher": [...]},
+#    "rutinas": ["<rutina_id>", ...]}   (ids como texto: indexables con jsonb ?|)
+# Cada bloque = salida de _split_blocks_from_text + "ref" (id rutina/ejercicio).
+# Los bloques solo dependen del texto del plan: los items de cada rutina se resuelven
+# al leer, así que un cambio de versión de rutina no obliga a recompilar.
+PLAN_BLOCKS_FORMAT = 1
+PLAN_SECTIONS = ("warmup", "main", "finisher")
+
+
+def _bump_rutina_versions(rutina_ids) -> None:
+    """Marca rutinas como editadas (invalida caché de items y ETags que las referencian)."""
+    ids = sorted({int(x) for x in rutina_ids if x})
+    if not ids:
+        return
+    Rutina.query.filter(Rutina.id.in_(ids)).update(
+        {Rutina.version: Rutina.version + 1},
+        synchronize_session=False,
+    )
+
+
+def _bump_rutinas_using_ejercicios(ejercicio_ids) -> None:
+    """El payload de items incluye el video del ejercicio => invalidar rutinas que lo usan."""
+    ids = sorted({int(x) for x in ejercicio_ids if x})
+    if not ids:
+        return
+    rids = [
+        rid for (rid,) in db.session.query(RutinaItem.rutina_id)
+        .filter(RutinaItem.ejercicio_id.in_(ids))
+        .distinct()
+        .all()
+    ]
+    _bump_rutina_versions(rids)
+
+
+def _parse_plan_sections(plan: DiaPlan) -> Dict[str, List[Dict[str, Any]]]:
+    out: Dict[str, List[Dict[str, Any]]] = {}
+    for sec in PLAN_SECTIONS:
+        blocks_src = _split_blocks_from_text(getattr(plan, sec, "") or "")
+        for b in blocks_src:
+            b["ref"] = _block_ref_id(b)
+        out[sec] = blocks_src
+    return out
+
+
+def _compile_plans_blocks(plans: List[DiaPlan]) -> None:
+    """Compila y guarda plan.blocks para varios planes (sin queries: solo parsea texto)."""
+    for p in plans:
+        sections = _parse_plan_sections(p)
+        rids = _collect_block_refs(sections)[0]
+        p.blocks = {
+            "v": PLAN_BLOCKS_FORMAT,
+            "sections": sections,
+            "rutinas": [str(rid) for rid in sorted(rids)],
+        }
+
+
+def _compile_plan_blocks(plan: DiaPlan) -> None:
+    _compile_plans_blocks([plan])
+
+
+def _compiled_sections(plan: DiaPlan) -> Optional[Dict[str, List[Dict[str, Any]]]]:
+    """Secciones compiladas si plan.blocks es válido (formato actual), si no None."""
+    data = getattr(plan, "blocks", None)
+    if not isinstance(data, dict) or data.get("v") != PLAN_BLOCKS_FORMAT:
+        return None
+    sections = data.get("sections")
+    if not isinstance(sections, dict) or not all(isinstance(sections.get(s), list) for s in PLAN_SECTIONS):
+        return None
+    return sections
+
+
+def _plans_sections_payload(plans: List[DiaPlan]) -> Dict[Any, List[Dict[str, Any]]]:
+    """
+    ✅ Payload de bloques para varios planes, clave (fecha, sección).
+    - Usa DiaPlan.blocks si está compilado (sin re-parsear texto).
+    - Filas legacy sin blocks => parser de texto en memoria (NO se guarda: lectura
+      sin escrituras; las compilan `flask vir compile-blocks` y los endpoints de escritura).
+    Los items de cada rutina se resuelven siempre al día (_load_blocks_refs).
+    """
+    parsed: Dict[Any, List[Dict[str, Any]]] = {}
+    for p in plans:
+        sections = _compiled_sections(p)
+        if sections is None:
+            sections = _parse_plan_sections(p)
+        for sec in PLAN_SECTIONS:
+            parsed[(p.fecha, sec)] = sections[sec]
+
+    return _resolve_sections(parsed)[0]
+
+
 # =============================================================
 # ✅ EJERCICIOS POR GRUPO MUSCULAR
 # =============================================================
@@ -508,11 +843,16 @@ def categoria_to_muscle_group(categoria: str) -> str:
     return "Core"
 
 
+def _ejercicio_group(e: Ejercicio) -> str:
+    return getattr(e, "grupo_muscular", None) or categoria_to_muscle_group(getattr(e, "categoria", "") or "")
+
+
 def build_ejercicios_por_grupo(ejercicios: List[Ejercicio]) -> Dict[str, List[Dict[str, Any]]]:
+    """Agrupa en el orden recibido (ejercicios_catalog ya los trae por grupo, nombre)."""
     grouped: Dict[str, List[Dict[str, Any]]] = {g: [] for g in MUSCLE_GROUPS_ORDER}
 
     for e in ejercicios:
-        g = categoria_to_muscle_group(getattr(e, "categoria", "") or "")
+        g = _ejercicio_group(e)
         video_url = ""
         if getattr(e, "video_filename", ""):
             video_url = url_for("static", filename=f"videos/{e.video_filename}")
@@ -527,13 +867,111 @@ def build_ejercicios_por_grupo(ejercicios: List[Ejercicio]) -> Dict[str, List[Di
             "video_filename": getattr(e, "video_filename", "") or "",
         })
 
-    for g in list(grouped.keys()):
-        grouped[g].sort(key=lambda x: (x.get("nombre") or "").lower())
-
     grouped = {g: grouped[g] for g in MUSCLE_GROUPS_ORDER if grouped.get(g)}
     return grouped
 
 
+# =============================================================
+# ✅ CACHES VERSIONADOS (cache_versions)
+# =============================================================
+CATALOG_EJERCICIOS = "ejercicios_catalog"
+
+
+def cache_version(name: str) -> int:
+    v = db.session.query(CacheVersion.version).filter(CacheVersion.name == name).scalar()
+    return int(v or 0)
+
+
+def bump_cache_version(name: str) -> None:
+    """Invalida `name` en todos los workers (upsert version+1). NO hace commit."""
+    table = CacheVersion.__table__
+    stmt = dialect_insert(table).values(name=name, version=1, updated_at=datetime.utcnow())
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.name],
+        set_={"version": table.c.version + 1, "updated_at": stmt.excluded.updated_at},
+    )
+    db.session.execute(stmt)
+
+
+def ejercicios_catalog() -> Dict[str, List[Dict[str, Any]]]:
+    """
+    ✅ Catálogo agrupado por grupo muscular, cacheado por proceso.
+    Hit: 1 query (versión por PK). Miss: + 1 query ordenada por
+    ix_ejercicios_grupo_nombre. Se invalida con bump_cache_version(CATALOG_EJERCICIOS)
+    (alta/baja de ejercicio, link/unlink/borrado de video).
+    """
+    version = cache_version(CATALOG_EJERCICIOS)
+    cached = catalog_cache.get(CATALOG_EJERCICIOS, version)
+    if cached is not None:
+        return cached
+
+    ejercicios = (
+        Ejercicio.query
+        .order_by(Ejercicio.grupo_muscular.asc(), Ejercicio.nombre.asc())
+        .all()
+    )
+    if any(not e.grupo_muscular for e in ejercicios):
+        # filas sin backfill: agrupar igual, orden por nombre dentro del grupo
+        ejercicios.sort(key=lambda e: (e.nombre or "").lower())
+
+    grouped = build_ejercicios_por_grupo(ejercicios)
+    catalog_cache.put(CATALOG_EJERCICIOS, version, grouped)
+    return grouped
+
+
+# =============================================================
+# ✅ BÚSQUEDA DE EJERCICIOS (builder / planificador)
+# =============================================================
+EJ_SEARCH_LIMIT = 20
+EJ_SEARCH_MAX = 50
+
+
+def _ejercicio_search_row(e: Ejercicio) -> Dict[str, Any]:
+    return {
+        "id": e.id,
+        "nombre": e.nombre,
+        "categoria": e.categoria or "",
+        "descripcion": e.descripcion or "",
+        "grupo": _ejercicio_group(e),
+        "video_url": url_for("static", filename=f"videos/{e.video_filename}") if e.video_filename else "",
+    }
+
+
+@main_bp.route("/api/ejercicios/search")
+@login_required
+def api_ejercicios_search():
+    """
+    ?q= (typeahead, sin tildes, rankeado) & grupo= (grupo muscular) & limit=
+    Sin q: lista por nombre (con grupo: sale del catálogo cacheado).
+    """
+    if not admin_ok():
+        return jsonify({"ok": False, "error": "Acceso denegado"}), 403
+
+    q = (request.args.get("q") or "").strip()
+    grupo = (request.args.get("grupo") or "").strip() or None
+    limit = min(max(request.args.get("limit", type=int) or EJ_SEARCH_LIMIT, 1), EJ_SEARCH_MAX)
+
+    if not q and grupo:
+        items = [
+            {**{k: e[k] for k in ("id", "nombre", "categoria", "descripcion", "video_url")}, "grupo": grupo}
+            for e in ejercicios_catalog().get(grupo, [])[:limit]
+        ]
+        return jsonify({"ok": True, "items": items})
+
+    cols = load_only(
+        Ejercicio.id, Ejercicio.nombre, Ejercicio.categoria, Ejercicio.descripcion,
+        Ejercicio.video_filename, Ejercicio.grupo_muscular,
+    )
+    if not q:
+        rows = Ejercicio.query.options(cols).order_by(Ejercicio.nombre.asc()).limit(limit).all()
+    else:
+        ids = search_ejercicio_ids(q, limit=limit, grupo=grupo)
+        by_id = {e.id: e for e in Ejercicio.query.options(cols).filter(Ejercicio.id.in_(ids)).all()} if ids else {}
+        rows = [by_id[i] for i in ids if i in by_id]
+
+    return jsonify({"ok": True, "items": [_ejercicio_search_row(e) for e in rows]})
+
+
 # =============================================================
 # DB FIX (opcional)
 # =============================================================
@@ -572,40 +1010,500 @@ def admin_db_fix_tabata():
         return f"ERROR: {str(e)}", 500
 
 
-def ensure_week_plans(user_id: int, fechas: List[date]) -> Dict[date, DiaPlan]:
+@main_bp.route("/admin/cache_stats")
+@login_required
+def admin_cache_stats():
+    if not admin_ok():
+        return jsonify({"ok": False, "error": "Acceso denegado"}), 403
+    return jsonify({
+        "ok": True,
+        "rutina_cache": rutina_cache.stats(),
+        "catalog_cache": catalog_cache.stats(),
+        "http": http_metrics.stats(),
+    })
+
+
+def _virtual_plan(user_id: int, fecha: date) -> DiaPlan:
+    """DiaPlan 'Descanso' en memoria (NO se agrega a la sesión)."""
+    return DiaPlan(
+        user_id=user_id,
+        fecha=fecha,
+        plan_type="Descanso",
+        warmup="",
+        main="",
+        finisher="",
+        puede_entrenar="si",
+        comentario_atleta="",
+        propuesto_score=0,
+    )
+
+
+def load_plans(user_id: int, fechas: List[date]) -> Dict[date, DiaPlan]:
     """
-    ✅ Evita crashear si DiaPlan tiene atributo 'blocks' pero DB todavía no lo tiene.
-    Carga solo columnas seguras con load_only (no selecciona blocks).
+    ✅ Lectura SIN efectos: planes existentes + 'Descanso' virtual para los días
+    sin fila. Las filas solo se crean cuando alguien guarda algo.
     """
-    q = DiaPlan.query.options(load_only(
-        DiaPlan.id,
-        DiaPlan.user_id,
-        DiaPlan.fecha,
-        DiaPlan.plan_type,
-        DiaPlan.warmup,
-        DiaPlan.main,
-        DiaPlan.finisher,
-        DiaPlan.puede_entrenar,
-        DiaPlan.comentario_atleta,
-        DiaPlan.propuesto_score,
-    ))
-
-    existing = q.filter(
+    existing = DiaPlan.query.filter(
         DiaPlan.user_id == user_id,
-        DiaPlan.fecha >= fechas[0],
-        DiaPlan.fecha <= fechas[-1],
+        DiaPlan.fecha >= min(fechas),
+        DiaPlan.fecha <= max(fechas),
     ).all()
 
     by_date = {p.fecha: p for p in existing}
     for f in fechas:
         if f not in by_date:
-            p = DiaPlan(user_id=user_id, fecha=f, plan_type="Descanso")
-            db.session.add(p)
-            by_date[f] = p
-    db.session.commit()
+            by_date[f] = _virtual_plan(user_id, f)
     return by_date
 
 
+# filas por INSERT multi-VALUES (SQLite limita variables por statement)
+PLAN_UPSERT_CHUNK = 200
+
+
+def _default_plan_row(user_id: int, fecha: date, now: datetime) -> Dict[str, Any]:
+    return {
+        "user_id": user_id,
+        "fecha": fecha,
+        "plan_type": "Descanso",
+        "warmup": "",
+        "main": "",
+        "finisher": "",
+        "puede_entrenar": "si",
+        "comentario_atleta": "",
+        "propuesto_score": 0,
+        "updated_at": now,
+    }
+
+
+# =============================================================
+# ✅ CALENDARIO: resumen liviano por día (mes / año / equipo)
+# =============================================================
+CALENDAR_MAX_DAYS = 366
+
+
+def _json_value(v):
+    if isinstance(v, str):
+        try:
+            return json.loads(v)
+        except Exception:
+            return None
+    return v
+
+
+def calendar_summary(user_ids: List[int], start: date, end: date,
+                     with_rutinas: bool = False, pairs=None) -> Dict[tuple, Dict[str, Any]]:
+    """
+    ✅ UNA query (solo columnas necesarias, por índices user_id+fecha):
+    días del rango x atletas LEFT JOIN dia_plan / athlete_logs / checks / actividades Strava.
+    Los días sin fila salen como 'Descanso' (sin insertar nada).
+    + 1 query chica (items por rutina) para checks_total.
+
+    Devuelve {(user_id, fecha): {fecha, plan_type, puede_entrenar, did_train,
+                                checks_done, checks_total, has_activity}}.
+    with_rutinas=True agrega "rutinas": {rutina_id: cantidad de items} del día.
+    pairs: [(user_id, fecha)] exactos en vez del rectángulo atletas x rango
+    (user_ids / start / end deben cubrirlos: acotan checks y actividades).
+    """
+    user_ids = sorted({int(u) for u in user_ids if u})
+    if not user_ids:
+        return {}
+
+    pg = db_dialect() == "postgresql"
+    params: Dict[str, Any] = {}
+    if pairs is not None:
+        if not pairs:
+            return {}
+        values = []
+        for i, (uid, fecha) in enumerate(pairs):
+            params[f"pu{i}"] = int(uid)
+            params[f"pd{i}"] = _as_date(fecha).isoformat()
+            values.append(f"(CAST(:pu{i} AS INTEGER), CAST(:pd{i} AS DATE))" if pg else f"(:pu{i}, :pd{i})")
+        grid = f"grid(user_id, fecha) AS (VALUES {', '.join(values)}),"
+    else:
+        grid = """grid AS (
+            SELECT u.id AS user_id, d.fecha FROM users u CROSS JOIN days d WHERE u.id IN :uids
+        ),"""
+
+    if pg:
+        day0 = "CAST(:start AS DATE)"
+        next_day = "fecha + 1"
+        end_day = "CAST(:end AS DATE)"
+        act_day = "CAST(start_date AS DATE)"
+        plan_rutinas = "dp.blocks -> 'rutinas'"
+    else:
+        day0 = ":start"
+        next_day = "date(fecha, '+1 day')"
+        end_day = ":end"
+        act_day = "date(start_date)"
+        plan_rutinas = "json_extract(dp.blocks, '$.rutinas')"
+
+    sql = text(f"""
+        WITH RECURSIVE days(fecha) AS (
+            SELECT {day0}
+            UNION ALL
+            SELECT {next_day} FROM days WHERE fecha < {end_day}
+        ),
+        {grid}
+        chk AS (
+            SELECT user_id, fecha, SUM(CASE WHEN done THEN 1 ELSE 0 END) AS done_n
+            FROM athlete_checks
+            WHERE user_id IN :uids AND fecha >= :start AND fecha <= :end
+            GROUP BY user_id, fecha
+        ),
+        act AS (
+            SELECT user_id, {act_day} AS fecha, COUNT(*) AS n
+            FROM external_activities
+            WHERE user_id IN :uids AND start_date >= :start AND start_date < :end_excl
+            GROUP BY user_id, {act_day}
+        )
+        SELECT g.user_id, g.fecha, dp.id, dp.plan_type, dp.puede_entrenar, {plan_rutinas},
+               al.did_train, chk.done_n, act.n
+        FROM grid g
+        LEFT JOIN dia_plan dp ON dp.user_id = g.user_id AND dp.fecha = g.fecha
+        LEFT JOIN athlete_logs al ON al.user_id = g.user_id AND al.fecha = g.fecha
+        LEFT JOIN chk ON chk.user_id = g.user_id AND chk.fecha = g.fecha
+        LEFT JOIN act ON act.user_id = g.user_id AND act.fecha = g.fecha
+        ORDER BY g.user_id, g.fecha
+    """).bindparams(bindparam("uids", expanding=True))
+
+    rows = db.session.execute(sql, {
+        **params,
+        "uids": user_ids,
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "end_excl": (end + timedelta(days=1)).isoformat(),
+    }).all()
+
+    out: Dict[tuple, Dict[str, Any]] = {}
+    rutinas_by_day: Dict[tuple, set] = {}
+    legacy: Dict[int, tuple] = {}
+    for uid, fecha, plan_id, plan_type, puede, rutinas, did_train, done_n, act_n in rows:
+        fecha = _as_date(fecha)
+        key = (int(uid), fecha)
+
+        # solo blocks -> 'rutinas' (no el JSON entero); NULL => plan legacy sin compilar
+        compiled = _json_value(rutinas) if rutinas is not None else None
+        if isinstance(compiled, (list, dict)):
+            rutinas_by_day[key] = {int(r) for r in compiled}
+        elif plan_id:
+            legacy[int(plan_id)] = key
+
+        out[key] = {
+            "fecha": fecha.isoformat(),
+            "plan_type": plan_type or "Descanso",
+            "puede_entrenar": puede or "si",
+            "did_train": bool(did_train),
+            "checks_done": int(done_n or 0),
+            "checks_total": 0,
+            "has_activity": bool(act_n),
+        }
+
+    # filas legacy sin DiaPlan.blocks (ver `flask vir compile-blocks`): parsear texto
+    if legacy:
+        for p in DiaPlan.query.options(load_only(
+            DiaPlan.id, DiaPlan.warmup, DiaPlan.main, DiaPlan.finisher,
+        )).filter(DiaPlan.id.in_(list(legacy.keys()))).all():
+            rutinas_by_day[legacy[p.id]] = _collect_block_refs(_parse_plan_sections(p))[0]
+
+    all_rids = set().union(*rutinas_by_day.values()) if rutinas_by_day else set()
+    if all_rids:
+        counts = dict(
+            db.session.query(RutinaItem.rutina_id, func.count(RutinaItem.id))
+            .filter(RutinaItem.rutina_id.in_(sorted(all_rids)))
+            .group_by(RutinaItem.rutina_id)
+            .all()
+        )
+        for key, rids in rutinas_by_day.items():
+            out[key]["checks_total"] = sum(int(counts.get(r, 0)) for r in rids)
+            if with_rutinas:
+                out[key]["rutinas"] = {r: int(counts.get(r, 0)) for r in sorted(rids)}
+
+    return out
+
+
+@main_bp.route("/api/calendar_summary")
+@login_required
+def api_calendar_summary():
+    """Resumen por día (sin textos de bloques) para pintar mes/año."""
+    user_id = request.args.get("user_id", type=int)
+    from_str = request.args.get("from", type=str)
+    to_str = request.args.get("to", type=str)
+
+    if not user_id or not from_str or not to_str:
+        return jsonify({"ok": False, "error": "Faltan parámetros"}), 400
+
+    if not (admin_ok() or current_user.id == user_id):
+        return jsonify({"ok": False, "error": "Acceso denegado"}), 403
+
+    start = safe_parse_ymd(from_str, fallback=date.today())
+    end = safe_parse_ymd(to_str, fallback=start)
+    if end < start:
+        return jsonify({"ok": False, "error": "Rango inválido"}), 400
+    if (end - start).days + 1 > CALENDAR_MAX_DAYS:
+        return jsonify({"ok": False, "error": f"Máximo {CALENDAR_MAX_DAYS} días"}), 400
+
+    summary = calendar_summary([user_id], start, end)
+    days = [row for (_, _), row in sorted(summary.items(), key=lambda kv: kv[0][1])]
+    return jsonify({"ok": True, "from": start.isoformat(), "to": end.isoformat(), "days": days})
+
+
+# =============================================================
+# ✅ ADHERENCIA: rollup diario (athlete_day_stats) + reporte agregado
+# =============================================================
+ADHERENCE_WEEKS = 8
+ADHERENCE_MAX_WEEKS = 52
+ADHERENCE_CHUNK_DAYS = 62
+ADHERENCE_PAIRS_CHUNK = 500   # pares (user_id, fecha) por query (VALUES + DELETE ... IN)
+
+
+def refresh_day_stats(user_ids: List[int], start: date, end: date) -> int:
+    """
+    Recalcula el rollup SOLO de (atletas x días) tocados: calendar_summary + 1 query
+    de checks por rutina, DELETE del rango y INSERT de los días con algo.
+    Lo llaman los endpoints de escritura antes del commit. NO hace commit.
+    Devuelve filas escritas.
+    """
+    user_ids = sorted({int(u) for u in user_ids if u})
+    if not user_ids or end < start:
+        return 0
+    db.session.flush()
+
+    written = 0
+    chunk_start = start
+    while chunk_start <= end:
+        chunk_end = min(end, chunk_start + timedelta(days=ADHERENCE_CHUNK_DAYS - 1))
+        written += _rebuild_day_stats(user_ids, chunk_start, chunk_end)
+        chunk_start = chunk_end + timedelta(days=1)
+    return written
+
+
+def refresh_day_stats_pairs(keys) -> int:
+    """
+    Como refresh_day_stats pero SOLO los (user_id, fecha) dados (no el rectángulo
+    atletas x rango), en tandas de ADHERENCE_PAIRS_CHUNK. NO hace commit.
+    """
+    keys = sorted({(int(uid), _as_date(f)) for uid, f in keys if uid and f})
+    if not keys:
+        return 0
+    db.session.flush()
+
+    written = 0
+    for i in range(0, len(keys), ADHERENCE_PAIRS_CHUNK):
+        chunk = keys[i:i + ADHERENCE_PAIRS_CHUNK]
+        fechas = [f for _, f in chunk]
+        written += _rebuild_day_stats(
+            sorted({uid for uid, _ in chunk}), min(fechas), max(fechas), pairs=chunk,
+        )
+    return written
+
+
+def _rebuild_day_stats(user_ids: List[int], start: date, end: date, pairs=None) -> int:
+    """DELETE + INSERT del rollup de (atletas x [start, end]) o solo de `pairs`."""
+    summary = calendar_summary(user_ids, start, end, with_rutinas=True, pairs=pairs)
+
+    done_by_rutina: Dict[tuple, Dict[int, int]] = {}
+    for uid, fecha, rid, n in (
+        db.session.query(AthleteCheck.user_id, AthleteCheck.fecha, RutinaItem.rutina_id, func.count())
+        .join(RutinaItem, RutinaItem.id == AthleteCheck.rutina_item_id)
+        .filter(
+            AthleteCheck.user_id.in_(user_ids),
+            AthleteCheck.fecha >= start,
+            AthleteCheck.fecha <= end,
+            AthleteCheck.done.is_(True),
+        )
+        .group_by(AthleteCheck.user_id, AthleteCheck.fecha, RutinaItem.rutina_id)
+        .all()
+    ):
+        done_by_rutina.setdefault((int(uid), _as_date(fecha)), {})[int(rid)] = int(n)
+
+    rows = []
+    for (uid, fecha), d in summary.items():
+        planned = d["plan_type"] != "Descanso"
+        available = d["puede_entrenar"] != "no"
+        if not (planned or not available or d["did_train"] or d["checks_done"]):
+            continue
+        done = done_by_rutina.get((uid, fecha), {})
+        totals = d.get("rutinas") or {}
+        by_rutina = {
+            str(r): [done.get(r, 0), totals.get(r, 0)]
+            for r in sorted(set(totals) | set(done))
+            if totals.get(r) or done.get(r)
+        }
+        rows.append({
+            "user_id": uid,
+            "fecha": fecha,
+            "plan_type": (d["plan_type"] or "Descanso")[:40],
+            "planned": planned,
+            "available": available,
+            "did_train": d["did_train"],
+            "checks_done": d["checks_done"],
+            "checks_total": d["checks_total"],
+            "checks_by_rutina": by_rutina or None,
+        })
+
+    if pairs is not None:
+        where = [tuple_(AthleteDayStat.user_id, AthleteDayStat.fecha).in_(list(pairs))]
+    else:
+        where = [
+            AthleteDayStat.user_id.in_(user_ids),
+            AthleteDayStat.fecha >= start,
+            AthleteDayStat.fecha <= end,
+        ]
+    db.session.execute(
+        db.delete(AthleteDayStat).where(*where).execution_options(synchronize_session=False)
+    )
+    if rows:
+        db.session.execute(db.insert(AthleteDayStat), rows)
+    return len(rows)
+
+
+def _rutina_plan_days(rutina_ids) -> set:
+    """
+    (user_id, fecha) de los planes que referencian alguna de las rutinas.
+    Compilados: blocks -> 'rutinas' (Postgres: ?| con índice GIN ix_dia_plan_blocks_rutinas).
+    Legacy (blocks NULL): prefiltro por texto y se confirma parseando.
+    """
+    ids = sorted({int(x) for x in rutina_ids if x})
+    if not ids:
+        return set()
+
+    if db_dialect() == "postgresql":
+        sql = text("""
+            SELECT user_id, fecha FROM dia_plan
+            WHERE blocks IS NOT NULL AND blocks -> 'rutinas' ?| CAST(:rids AS text[])
+        """)
+        rids: List[Any] = [str(r) for r in ids]
+    else:
+        # lista de ids (actual) o {id: versión} (formato viejo)
+        sql = text("""
+            SELECT user_id, fecha FROM dia_plan
+            WHERE blocks IS NOT NULL AND EXISTS (
+                SELECT 1 FROM json_each(dia_plan.blocks, '$.rutinas') je
+                WHERE CAST(CASE WHEN json_type(dia_plan.blocks, '$.rutinas') = 'object'
+                                THEN je.key ELSE je.value END AS INTEGER) IN :rids
+            )
+        """).bindparams(bindparam("rids", expanding=True))
+        rids = ids
+    keys = {(int(uid), _as_date(f)) for uid, f in db.session.execute(sql, {"rids": rids}).all()}
+
+    cols = (DiaPlan.warmup, DiaPlan.main, DiaPlan.finisher)
+    for p in DiaPlan.query.options(load_only(
+        DiaPlan.id, DiaPlan.user_id, DiaPlan.fecha, DiaPlan.warmup, DiaPlan.main, DiaPlan.finisher,
+    )).filter(
+        DiaPlan.blocks.is_(None),
+        or_(*[c.like(f"%{rid}%") for rid in ids for c in cols]),
+    ).all():
+        if _collect_block_refs(_parse_plan_sections(p))[0] & set(ids):
+            keys.add((int(p.user_id), _as_date(p.fecha)))
+    return keys
+
+
+def _check_days_for_items(item_ids) -> set:
+    """(user_id, fecha) con checks de esos items (llamar ANTES de borrarlos)."""
+    ids = sorted({int(x) for x in item_ids if x})
+    if not ids:
+        return set()
+    return {
+        (int(uid), _as_date(f)) for uid, f in
+        db.session.query(AthleteCheck.user_id, AthleteCheck.fecha)
+        .filter(AthleteCheck.rutina_item_id.in_(ids))
+        .distinct()
+        .all()
+    }
+
+
+def refresh_rutina_day_stats(rutina_ids, extra_days=()) -> int:
+    """
+    Items agregados / borrados cambian checks_total y checks_by_rutina de los días que
+    usan la rutina: recalcula SOLO esos (user_id, fecha) + extra_days (días con checks
+    borrados). NO hace commit.
+    """
+    return refresh_day_stats_pairs(_rutina_plan_days(rutina_ids) | set(extra_days))
+
+
+def adherence_report(start: date, end: date, grupo: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    ✅ UNA query agregada sobre el rollup: atletas x semana (LEFT JOIN => atletas sin
+    filas salen en 0). Adherencia = días planificados y disponibles entrenados / planificados.
+    """
+    if db_dialect() == "postgresql":
+        week = "(s.fecha - CAST(:start AS DATE)) / 7"
+    else:
+        week = "CAST((julianday(s.fecha) - julianday(:start)) / 7 AS INTEGER)"
+
+    grupo_sql = "AND u.grupo = :grupo" if grupo else ""
+    sql = text(f"""
+        SELECT u.id, u.nombre, u.grupo, {week} AS wk,
+               SUM(CASE WHEN s.planned AND s.available THEN 1 ELSE 0 END) AS planned,
+               SUM(CASE WHEN s.planned AND s.available AND s.did_train THEN 1 ELSE 0 END) AS trained_planned,
+               SUM(CASE WHEN s.did_train THEN 1 ELSE 0 END) AS trained,
+               SUM(CASE WHEN NOT s.available THEN 1 ELSE 0 END) AS unavailable,
+               COALESCE(SUM(s.checks_done), 0) AS checks_done,
+               COALESCE(SUM(s.checks_total), 0) AS checks_total
+        FROM users u
+        LEFT JOIN athlete_day_stats s
+               ON s.user_id = u.id AND s.fecha >= :start AND s.fecha <= :end
+        WHERE u.is_admin = :no {grupo_sql}
+        GROUP BY u.id, u.nombre, u.grupo, wk
+        ORDER BY u.nombre, u.id, wk
+    """)
+    params: Dict[str, Any] = {"start": start.isoformat(), "end": end.isoformat(), "no": False}
+    if grupo:
+        params["grupo"] = grupo
+
+    def pct(a: int, b: int) -> Optional[float]:
+        return round(100.0 * a / b, 1) if b else None
+
+    keys = ("planned", "trained_planned", "trained", "unavailable", "checks_done", "checks_total")
+    n_weeks = (end - start).days // 7 + 1
+    out: Dict[int, Dict[str, Any]] = {}
+    for uid, nombre, grp, wk, *vals in db.session.execute(sql, params):
+        a = out.get(uid)
+        if a is None:
+            a = out[uid] = {
+                "id": uid, "nombre": nombre, "grupo": grp or "",
+                **{k: 0 for k in keys},
+                "weeks": [
+                    {"week_start": (start + timedelta(days=7 * i)).isoformat(), **{k: 0 for k in keys}}
+                    for i in range(n_weeks)
+                ],
+            }
+        if wk is None:
+            continue
+        w = a["weeks"][int(wk)]
+        for k, v in zip(keys, vals):
+            w[k] = int(v or 0)
+            a[k] += int(v or 0)
+
+    for a in out.values():
+        for row in [a, *a["weeks"]]:
+            row["adherence_pct"] = pct(row["trained_planned"], row["planned"])
+            row["checks_pct"] = pct(row["checks_done"], row["checks_total"])
+    return list(out.values())
+
+
+@main_bp.route("/api/coach/adherence")
+@login_required
+def api_coach_adherence():
+    """?weeks=8&end=YYYY-MM-DD&grupo=G1 => adherencia por atleta y por semana (desde el rollup)."""
+    if not admin_ok():
+        return jsonify({"ok": False, "error": "Acceso denegado"}), 403
+
+    weeks = request.args.get("weeks", default=ADHERENCE_WEEKS, type=int)
+    weeks = max(1, min(int(weeks or ADHERENCE_WEEKS), ADHERENCE_MAX_WEEKS))
+    end = safe_parse_ymd(request.args.get("end", ""), fallback=date.today())
+    start = end - timedelta(days=7 * weeks - 1)
+    grupo = (request.args.get("grupo") or "").strip() or None
+
+    return jsonify({
+        "ok": True,
+        "from": start.isoformat(),
+        "to": end.isoformat(),
+        "weeks": weeks,
+        "athletes": adherence_report(start, end, grupo),
+    })
+
+
 # =============================================================
 # AUTH
 # =============================================================
@@ -671,42 +1569,44 @@ def perfil_usuario(user_id: int):
     # ✅ Strava account robusto
     strava_account = get_strava_account(user.id)
 
-    # Consistencia semana
+    # Consistencia semana (+ mes si corresponde): UN resumen de calendario
     week_goal = 5
     fechas_semana = week_dates(hoy)
-    done_week = set()
-    logs_week = AthleteLog.query.filter(
-        AthleteLog.user_id == user.id,
-        AthleteLog.fecha >= fechas_semana[0],
-        AthleteLog.fecha <= fechas_semana[-1],
-        AthleteLog.did_train.is_(True),
-    ).all()
-    for l in logs_week:
-        done_week.add(l.fecha)
 
-    week_done = len(done_week)
+    summary_from, summary_to = fechas_semana[0], fechas_semana[-1]
+    if view == "month":
+        summary_from = min(summary_from, date(center.year, center.month, 1))
+        summary_to = max(summary_to, date(center.year, center.month, monthrange(center.year, center.month)[1]))
+    summary = {
+        f: row for (_, f), row in calendar_summary([user.id], summary_from, summary_to).items()
+    }
+
+    done_week = {f for f in fechas_semana if summary.get(f, {}).get("did_train")}
+
+    week_done = len(done_week)
 
     # ✅ streak real
     streak = compute_streak(user.id, hoy)
 
-    plan_hoy = DiaPlan.query.filter_by(user_id=user.id, fecha=hoy).first()
-    if not plan_hoy:
-        plan_hoy = DiaPlan(user_id=user.id, fecha=hoy, plan_type="Descanso")
-        db.session.add(plan_hoy)
-        db.session.commit()
+    plan_hoy = DiaPlan.query.filter_by(user_id=user.id, fecha=hoy).first() or _virtual_plan(user.id, hoy)
 
     fechas: List[date] = []
     planes: Dict[date, DiaPlan] = {}
     semana_str = ""
 
+    # ✅ rango que el front precarga con /api/days_detail
+    prefetch_from: Optional[date] = None
+    prefetch_to: Optional[date] = None
+
     if view == "week":
         fechas = week_dates(center)
         semana_str = f"{fechas[0].strftime('%d/%m')} - {fechas[-1].strftime('%d/%m')}"
-        planes = ensure_week_plans(user.id, fechas)
+        planes = load_plans(user.id, fechas)
+        prefetch_from, prefetch_to = fechas[0], fechas[-1]
 
     month_label = ""
     grid: List[List[Optional[date]]] = []
-    planes_mes: Dict[date, DiaPlan] = {}
+    planes_mes: Dict[date, Dict[str, Any]] = {}
 
     if view == "month":
         y, m = center.year, center.month
@@ -715,21 +1615,10 @@ def perfil_usuario(user_id: int):
 
         start = date(y, m, 1)
         end = date(y, m, monthrange(y, m)[1])
+        prefetch_from, prefetch_to = start, end
 
-        month_plans = DiaPlan.query.filter(
-            DiaPlan.user_id == user.id,
-            DiaPlan.fecha >= start,
-            DiaPlan.fecha <= end,
-        ).all()
-        planes_mes = {p.fecha: p for p in month_plans}
-
-        for w in grid:
-            for d in w:
-                if d and d not in planes_mes:
-                    p = DiaPlan(user_id=user.id, fecha=d, plan_type="Descanso")
-                    db.session.add(p)
-                    planes_mes[d] = p
-        db.session.commit()
+        # ✅ resumen liviano (sin textos warmup/main/finisher)
+        planes_mes = {d: summary[d] for w in grid for d in w if d}
 
     return render_template(
         "perfil.html",
@@ -749,6 +1638,8 @@ def perfil_usuario(user_id: int):
         month_grid=grid,
         planes_mes=planes_mes,
         strava_account=strava_account,
+        prefetch_from=prefetch_from,
+        prefetch_to=prefetch_to,
     )
 
 
@@ -762,22 +1653,14 @@ def dashboard_entrenador():
         flash("Acceso denegado", "danger")
         return redirect(url_for("main.perfil_redirect"))
 
-    rutinas = Rutina.query.order_by(Rutina.id.desc()).all()
-    ejercicios = Ejercicio.query.order_by(Ejercicio.id.desc()).all()
-    atletas = User.query.filter(User.is_admin.is_(False)).order_by(User.id.desc()).all()
-    available_videos = list_repo_videos()
-
-    # ✅ NUEVO: agrupados por grupo muscular (para organizar mejor en el template)
-    ejercicios_por_grupo = build_ejercicios_por_grupo(ejercicios)
+    # ✅ Solo el shell + 1ra página de rutinas (tab activa).
+    # El resto de las tabs se cargan on demand desde /api/coach/<tab>.
+    rutinas_page = _coach_page("rutinas", q="", cursor=None, limit=COACH_PAGE_SIZE)
 
     return render_template(
         "panel_entrenador.html",
-        rutinas=rutinas,
-        ejercicios=ejercicios,
-        atletas=atletas,
-        available_videos=available_videos,
-        ejercicios_por_grupo=ejercicios_por_grupo,
-        muscle_groups_order=MUSCLE_GROUPS_ORDER,
+        rutinas_page=rutinas_page,
+        page_size=COACH_PAGE_SIZE,
     )
 
 
@@ -787,6 +1670,129 @@ def dashboard_entrenador_alias():
     return dashboard_entrenador()
 
 
+# =============================================================
+# ✅ PANEL: listados paginados (keyset) + búsqueda, por tab
+# =============================================================
+COACH_PAGE_SIZE = 25
+COACH_PAGE_MAX = 100
+
+
+def _like(q: str) -> str:
+    esc = q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{esc}%"
+
+
+def _rutina_row(r: Rutina) -> Dict[str, Any]:
+    return {
+        "id": r.id,
+        "nombre": r.nombre,
+        "tipo": r.tipo or "",
+        "descripcion": r.descripcion or "",
+        "builder_url": url_for("main.rutina_builder", rutina_id=r.id),
+        "tabata_url": url_for("main.rutina_tabata_player", rutina_id=r.id),
+        "settings_url": url_for("main.rutina_tabata_settings", rutina_id=r.id),
+    }
+
+
+def _ejercicio_row(e: Ejercicio) -> Dict[str, Any]:
+    return {
+        "id": e.id,
+        "nombre": e.nombre,
+        "categoria": e.categoria or "",
+        "video_filename": e.video_filename or "",
+    }
+
+
+def _atleta_row(u: User) -> Dict[str, Any]:
+    return {
+        "id": u.id,
+        "nombre": u.nombre,
+        "email": u.email,
+        "grupo": u.grupo or "",
+        "perfil_url": url_for("main.perfil_usuario", user_id=u.id, view="week"),
+        "delete_url": url_for("main.admin_delete_user", user_id=u.id),
+    }
+
+
+def _coach_page(kind: str, q: str, cursor: str | None, limit: int) -> Dict[str, Any]:
+    """
+    Página de un listado del panel. Keyset: rutinas/ejercicios/atletas por id DESC
+    (cursor = último id), videos por nombre (cursor = último archivo).
+    Devuelve {"items": [...], "next_cursor": str|None}.
+    """
+    q = (q or "").strip()
+
+    if kind == "videos":
+        names = list_repo_videos()
+        if q:
+            ql = q.lower()
+            names = [n for n in names if ql in n.lower()]
+        if cursor:
+            names = [n for n in names if n > cursor]
+        page = names[:limit]
+        more = len(names) > limit
+        return {
+            "items": [{"filename": n} for n in page],
+            "next_cursor": page[-1] if more and page else None,
+        }
+
+    if kind == "rutinas":
+        model, to_row = Rutina, _rutina_row
+        query = Rutina.query.options(load_only(Rutina.id, Rutina.nombre, Rutina.tipo, Rutina.descripcion))
+        search_cols = (Rutina.nombre, Rutina.tipo, Rutina.descripcion)
+    elif kind == "ejercicios":
+        model, to_row = Ejercicio, _ejercicio_row
+        query = Ejercicio.query
+        search_cols = (Ejercicio.nombre, Ejercicio.categoria)
+    elif kind == "atletas":
+        model, to_row = User, _atleta_row
+        query = User.query.options(load_only(User.id, User.nombre, User.email, User.grupo)).filter(
+            User.is_admin.is_(False)
+        )
+        search_cols = (User.nombre, User.email, User.grupo)
+    else:
+        raise ValueError(kind)
+
+    if q:
+        pat = _like(q)
+        query = query.filter(or_(*[col.ilike(pat, escape="\\") for col in search_cols]))
+
+    after_id = None
+    if cursor:
+        try:
+            after_id = int(cursor)
+        except ValueError:
+            after_id = None
+    if after_id:
+        query = query.filter(model.id < after_id)
+
+    rows = query.order_by(model.id.desc()).limit(limit + 1).all()
+    more = len(rows) > limit
+    rows = rows[:limit]
+    return {
+        "items": [to_row(r) for r in rows],
+        "next_cursor": str(rows[-1].id) if more and rows else None,
+    }
+
+
+@main_bp.route("/api/coach/<kind>")
+@login_required
+def api_coach_list(kind: str):
+    if not admin_ok():
+        return jsonify({"ok": False, "error": "Acceso denegado"}), 403
+    if kind not in {"rutinas", "ejercicios", "atletas", "videos"}:
+        return jsonify({"ok": False, "error": "Listado inválido"}), 404
+
+    limit = min(max(request.args.get("limit", type=int) or COACH_PAGE_SIZE, 1), COACH_PAGE_MAX)
+    page = _coach_page(
+        kind,
+        q=request.args.get("q", ""),
+        cursor=(request.args.get("cursor") or "").strip() or None,
+        limit=limit,
+    )
+    return jsonify({"ok": True, **page})
+
+
 # =============================================================
 # ELIMINAR VIDEO DESDE BANCO (ADMIN)
 # =============================================================
@@ -808,6 +1814,9 @@ def admin_delete_video():
         affected = Ejercicio.query.filter(Ejercicio.video_filename == filename).all()
         for e in affected:
             e.video_filename = ""
+        _bump_rutinas_using_ejercicios([e.id for e in affected])
+        if affected:
+            bump_cache_version(CATALOG_EJERCICIOS)
         db.session.commit()
 
         flash(f"🗑️ Video eliminado: {filename} (refs DB: {len(affected)})", "success")
@@ -838,7 +1847,11 @@ def admin_delete_ejercicio(ejercicio_id: int):
         items = RutinaItem.query.filter_by(ejercicio_id=ej.id).all()
         item_ids = [it.id for it in items]
 
+        # rutinas afectadas => nueva versión (invalida cache + DiaPlan.blocks)
+        _bump_rutina_versions({it.rutina_id for it in items})
+
         # 2) Checks asociados (si existen)
+        check_days = _check_days_for_items(item_ids)
         if item_ids:
             AthleteCheck.query.filter(
                 AthleteCheck.rutina_item_id.in_(item_ids)
@@ -850,6 +1863,8 @@ def admin_delete_ejercicio(ejercicio_id: int):
 
         # 4) Borrar el ejercicio
         db.session.delete(ej)
+        bump_cache_version(CATALOG_EJERCICIOS)
+        refresh_rutina_day_stats({it.rutina_id for it in items}, check_days)
         db.session.commit()
 
         # 5) Si el video ya no lo usa nadie, intentar borrarlo del /static/videos
@@ -883,6 +1898,8 @@ def admin_unlink_video_ejercicio(ejercicio_id: int):
 
     ej = Ejercicio.query.get_or_404(ejercicio_id)
     ej.video_filename = ""
+    _bump_rutinas_using_ejercicios([ej.id])
+    bump_cache_version(CATALOG_EJERCICIOS)
     db.session.commit()
 
     flash("✅ Video desvinculado del ejercicio", "success")
@@ -900,7 +1917,6 @@ def rutina_builder(rutina_id: int):
         return redirect(url_for("main.perfil_redirect"))
 
     rutina = Rutina.query.get_or_404(rutina_id)
-    ejercicios = Ejercicio.query.order_by(Ejercicio.nombre.asc()).all()
     items = (
         RutinaItem.query.filter_by(rutina_id=rutina.id)
         .order_by(RutinaItem.posicion.asc(), RutinaItem.id.asc())
@@ -909,7 +1925,6 @@ def rutina_builder(rutina_id: int):
     return render_template(
         "rutina_builder.html",
         rutina=rutina,
-        ejercicios=ejercicios,
         items=items,
     )
 
@@ -936,7 +1951,7 @@ def rutina_add_item(rutina_id: int):
         return redirect(url_for("main.rutina_builder", rutina_id=rutina.id))
 
     max_pos = db.session.query(db.func.max(RutinaItem.posicion)).filter_by(rutina_id=rutina.id).scalar()
-    next_pos = int(max_pos or 0) + 1
+    next_pos = int(max_pos or 0) + ITEM_POS_GAP
 
     it = RutinaItem(
         rutina_id=rutina.id,
@@ -950,6 +1965,8 @@ def rutina_add_item(rutina_id: int):
         posicion=next_pos,
     )
     db.session.add(it)
+    _bump_rutina_versions([rutina.id])
+    refresh_rutina_day_stats([rutina.id])
     db.session.commit()
 
     flash("✅ Ejercicio añadido", "success")
@@ -972,6 +1989,7 @@ def rutina_update_item(rutina_id: int, item_id: int):
     it.descanso = (request.form.get("descanso") or "").strip() or None
     it.nota = (request.form.get("nota") or "").strip() or None
 
+    _bump_rutina_versions([rutina.id])
     db.session.commit()
     flash("✅ Cambios guardados", "success")
     return redirect(url_for("main.rutina_builder", rutina_id=rutina.id))
@@ -987,34 +2005,507 @@ def rutina_delete_item(rutina_id: int, item_id: int):
     rutina = Rutina.query.get_or_404(rutina_id)
     it = RutinaItem.query.filter_by(id=item_id, rutina_id=rutina.id).first_or_404()
 
+    check_days = _check_days_for_items([it.id])
+    AthleteCheck.query.filter(AthleteCheck.rutina_item_id == it.id).delete(synchronize_session=False)
     db.session.delete(it)
+    _bump_rutina_versions([rutina.id])
+    refresh_rutina_day_stats([rutina.id], check_days)
     db.session.commit()
     flash("🗑️ Eliminado", "success")
     return redirect(url_for("main.rutina_builder", rutina_id=rutina.id))
 
 
+# Posiciones con huecos (1024, 2048, ...): mover 1 item = UPDATE de 1 fila
+# (punto medio entre vecinos). Solo si no queda hueco se renumera toda la rutina.
+ITEM_POS_GAP = 1024
+
+
+def _rutina_item_positions(rutina_id: int) -> List[tuple]:
+    """[(item_id, posicion)] en orden de la rutina (1 query liviana)."""
+    return [
+        (int(iid), pos) for iid, pos in db.session.query(RutinaItem.id, RutinaItem.posicion)
+        .filter(RutinaItem.rutina_id == rutina_id)
+        .order_by(RutinaItem.posicion.asc(), RutinaItem.id.asc())
+        .all()
+    ]
+
+
+def _renumber_rutina_items(rutina_id: int, ordered_ids: List[int]) -> int:
+    """✅ Aplica un orden completo con UN UPDATE ... SET posicion = CASE id ... (scoped a la rutina)."""
+    if not ordered_ids:
+        return 0
+    pos = {int(iid): (idx + 1) * ITEM_POS_GAP for idx, iid in enumerate(ordered_ids)}
+    stmt = (
+        db.update(RutinaItem)
+        .where(RutinaItem.rutina_id == rutina_id, RutinaItem.id.in_(list(pos)))
+        .values(posicion=case(pos, value=RutinaItem.id))
+        .execution_options(synchronize_session=False)
+    )
+    return db.session.execute(stmt).rowcount
+
+
+def _reorder_rutina_items(rutina_id: int, order: List[int], rows: Optional[List[tuple]] = None) -> int:
+    """
+    Orden completo. ValueError si hay ids de otra rutina o repetidos.
+    Items que falten en `order` (ej: agregados en otra pestaña) quedan al final.
+    """
+    rows = rows if rows is not None else _rutina_item_positions(rutina_id)
+    current = [iid for iid, _ in rows]
+    if len(set(order)) != len(order):
+        raise ValueError("ids repetidos en order")
+    foreign = set(order) - set(current)
+    if foreign:
+        raise ValueError(f"ids que no son de esta rutina: {sorted(foreign)}")
+    listed = set(order)
+    return _renumber_rutina_items(rutina_id, list(order) + [i for i in current if i not in listed])
+
+
+def _move_rutina_item(rutina_id: int, item_id: int, after_id: Optional[int],
+                      rows: Optional[List[tuple]] = None) -> int:
+    """
+    ✅ Mueve item_id justo después de after_id (None = al principio).
+    Normalmente 1 UPDATE de 1 fila; renumera todo solo si no hay hueco o hay
+    posiciones legacy (NULL / repetidas). Devuelve filas actualizadas.
+    """
+    rows = rows if rows is not None else _rutina_item_positions(rutina_id)
+    pos = dict(rows)
+    if item_id not in pos or (after_id is not None and after_id not in pos):
+        raise ValueError("Item que no es de esta rutina")
+    if after_id == item_id:
+        return 0
+
+    order = [iid for iid, _ in rows if iid != item_id]
+    idx = order.index(after_id) + 1 if after_id is not None else 0
+
+    values = [p for _, p in rows]
+    legacy = any(p is None for p in values) or any(b <= a for a, b in zip(values, values[1:]))
+
+    prev_pos = pos[order[idx - 1]] if idx > 0 else None
+    next_pos = pos[order[idx]] if idx < len(order) else None
+
+    new_pos = None
+    if not legacy:
+        if prev_pos is None and next_pos is None:
+            new_pos = ITEM_POS_GAP
+        elif prev_pos is None:
+            new_pos = next_pos - ITEM_POS_GAP
+        elif next_pos is None:
+            new_pos = prev_pos + ITEM_POS_GAP
+        elif next_pos - prev_pos >= 2:
+            new_pos = (prev_pos + next_pos) // 2
+
+    if new_pos is None:
+        order.insert(idx, item_id)
+        return _renumber_rutina_items(rutina_id, order)
+
+    if new_pos == pos[item_id]:
+        return 0
+    stmt = (
+        db.update(RutinaItem)
+        .where(RutinaItem.rutina_id == rutina_id, RutinaItem.id == item_id)
+        .values(posicion=new_pos)
+        .execution_options(synchronize_session=False)
+    )
+    return db.session.execute(stmt).rowcount
+
+
 @main_bp.route("/rutina/<int:rutina_id>/items/reorder", methods=["POST"])
 @login_required
 def rutina_reorder(rutina_id: int):
+    """
+    JSON:
+      {"move": {"id": 12, "after": 7 | null}}  => 1 fila (drag & drop)
+      {"order": [ids...]}                     => orden completo (1 UPDATE con CASE)
+    """
     if not admin_ok():
         return jsonify({"ok": False, "error": "Acceso denegado"}), 403
 
     data = request.get_json(silent=True) or {}
-    order = data.get("order") or []
-    if not isinstance(order, list):
-        return jsonify({"ok": False, "error": "order inválido"}), 400
+    move = data.get("move")
+    order = data.get("order")
+
+    try:
+        if isinstance(move, dict):
+            after = move.get("after")
+            updated = _move_rutina_item(
+                rutina_id,
+                int(move.get("id")),
+                int(after) if after is not None else None,
+            )
+        elif isinstance(order, list):
+            updated = _reorder_rutina_items(rutina_id, [int(x) for x in order])
+        else:
+            return jsonify({"ok": False, "error": "order inválido"}), 400
+    except (TypeError, ValueError) as e:
+        db.session.rollback()
+        return jsonify({"ok": False, "error": str(e) or "order inválido"}), 400
+
+    if updated:
+        _bump_rutina_versions([rutina_id])
+    db.session.commit()
+    return jsonify({"ok": True, "updated": updated})
+
+
+# ✅ Batch del builder: el front edita local y sincroniza todo en 1 request / 1 transacción.
+RUTINA_BATCH_MAX_OPS = 200
+ITEM_EDIT_FIELDS = ("series", "reps", "peso", "descanso", "nota")
+
+
+def _rutina_items_full(rutina_id: int) -> List[RutinaItem]:
+    return (
+        RutinaItem.query.options(joinedload(RutinaItem.ejercicio))
+        .filter(RutinaItem.rutina_id == rutina_id)
+        .order_by(RutinaItem.posicion.asc(), RutinaItem.id.asc())
+        .all()
+    )
+
+
+def _kept_positions(order: List[Any], pos: Dict[int, int]) -> set:
+    """
+    Ids existentes que pueden conservar su posicion: la subsecuencia creciente
+    más larga del orden final (O(n²), las rutinas son chicas). El resto se reubica.
+    """
+    keys = [k for k in order if pos.get(k) is not None]
+    best: List[List[Any]] = []
+    for i, k in enumerate(keys):
+        prev = [best[j] for j in range(i) if pos[keys[j]] < pos[k]]
+        best.append(max(prev, key=len, default=[]) + [k])
+    return set(max(best, key=len, default=[]))
+
+
+def _plan_positions(order: List[Any], pos: Dict[int, Optional[int]]) -> Dict[Any, int]:
+    """
+    {key: nueva posicion} solo para lo que cambia (items nuevos incluidos).
+    Rellena huecos entre items que no se mueven; si no entra (o hay posiciones
+    legacy NULL), renumera todo.
+    """
+    if any(pos[k] is None for k in order if k in pos):
+        return _renumber_positions(order, pos)
+
+    kept = _kept_positions(order, pos)
+    out: Dict[Any, int] = {}
+    run: List[Any] = []
+    prev_pos: Optional[int] = None
+
+    def place(next_pos: Optional[int]) -> bool:
+        n = len(run)
+        if not n:
+            return True
+        if next_pos is None:
+            base = prev_pos if prev_pos is not None else 0
+            out.update({k: base + ITEM_POS_GAP * (j + 1) for j, k in enumerate(run)})
+        elif prev_pos is None:
+            out.update({k: next_pos - ITEM_POS_GAP * (n - j) for j, k in enumerate(run)})
+        else:
+            step = (next_pos - prev_pos) // (n + 1)
+            if step < 1:
+                return False
+            out.update({k: prev_pos + step * (j + 1) for j, k in enumerate(run)})
+        run.clear()
+        return True
+
+    for k in order:
+        if k in kept:
+            if not place(pos[k]):
+                break
+            prev_pos = pos[k]
+        else:
+            run.append(k)
+    else:
+        if place(None):
+            return out
+
+    # sin hueco => renumerar (1024, 2048, ...)
+    return _renumber_positions(order, pos)
+
+
+def _renumber_positions(order: List[Any], pos: Dict[int, Optional[int]]) -> Dict[Any, int]:
+    full = {k: (idx + 1) * ITEM_POS_GAP for idx, k in enumerate(order)}
+    return {k: p for k, p in full.items() if pos.get(k) != p}
+
 
-    for idx, item_id in enumerate(order):
+def _apply_rutina_batch(rutina: Rutina, ops: List[Dict[str, Any]]) -> Dict[str, int]:
+    """
+    Aplica ops sobre la rutina (sin commit). ValueError("op N: ...") ante cualquier op
+    inválida: el caller hace rollback y no queda nada a medias.
+
+      {"op": "add", "ejercicio_id": 5, "series": "3", ..., "after": id|tmp|null, "tmp_id": "n1"}
+      {"op": "update", "id": 12, "fields": {"reps": "10"}}
+      {"op": "delete", "id": 12}
+      {"op": "move", "id": 12, "after": 7 | "n1" | null}
+
+    `after` ausente en add = al final; null = al principio. Un tmp_id de un add previo
+    sirve como id/after en ops siguientes. Devuelve {tmp_id: id real}.
+    """
+    items = {it.id: it for it in _rutina_items_full(rutina.id)}
+    order: List[Any] = list(items)
+    pos = {iid: it.posicion for iid, it in items.items()}
+
+    ej_ids = {int(op["ejercicio_id"]) for op in ops if op.get("op") == "add" and str(op.get("ejercicio_id", "")).isdigit()}
+    ejercicios = {e.id: e for e in Ejercicio.query.filter(Ejercicio.id.in_(ej_ids)).all()} if ej_ids else {}
+
+    new_items: Dict[str, RutinaItem] = {}
+    deleted: set = set()
+
+    def ref(value, n: int):
+        if isinstance(value, str) and value in new_items:
+            return value
         try:
-            item_id = int(item_id)
-        except Exception:
-            continue
-        it = RutinaItem.query.filter_by(id=item_id, rutina_id=rutina_id).first()
-        if it:
-            it.posicion = idx
+            key = int(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"op {n}: id inválido {value!r}")
+        if key not in items or key in deleted:
+            raise ValueError(f"op {n}: el item {key} no es de esta rutina")
+        return key
+
+    def item_for(key) -> RutinaItem:
+        return new_items[key] if isinstance(key, str) else items[key]
+
+    def insert_after(key, after, n: int) -> None:
+        if after is None:
+            order.insert(0, key)
+        else:
+            a = ref(after, n)
+            if a == key:
+                raise ValueError(f"op {n}: after no puede ser el mismo item")
+            order.insert(order.index(a) + 1, key)
+
+    for n, op in enumerate(ops):
+        if not isinstance(op, dict):
+            raise ValueError(f"op {n}: formato inválido")
+        kind = op.get("op")
+
+        if kind == "add":
+            try:
+                ej = ejercicios.get(int(op.get("ejercicio_id")))
+            except (TypeError, ValueError):
+                ej = None
+            if not ej:
+                raise ValueError(f"op {n}: ejercicio inválido")
+            tmp = str(op.get("tmp_id") or f"_new{n}")
+            if tmp in new_items:
+                raise ValueError(f"op {n}: tmp_id repetido {tmp!r}")
+            new_items[tmp] = RutinaItem(
+                rutina_id=rutina.id,
+                ejercicio_id=ej.id,
+                nombre=ej.nombre,
+                **{f: (str(op.get(f) or "")).strip() or None for f in ITEM_EDIT_FIELDS},
+            )
+            if "after" in op:
+                insert_after(tmp, op.get("after"), n)
+            else:
+                order.append(tmp)
+
+        elif kind == "update":
+            key = ref(op.get("id"), n)
+            fields = op.get("fields") if isinstance(op.get("fields"), dict) else op
+            it = item_for(key)
+            for f in ITEM_EDIT_FIELDS:
+                if f in fields:
+                    setattr(it, f, (str(fields.get(f) or "")).strip() or None)
+
+        elif kind == "delete":
+            key = ref(op.get("id"), n)
+            order.remove(key)
+            if isinstance(key, str):
+                new_items.pop(key)
+            else:
+                deleted.add(key)
 
+        elif kind == "move":
+            key = ref(op.get("id"), n)
+            after = op.get("after")
+            if after is not None and ref(after, n) == key:
+                continue
+            order.remove(key)
+            insert_after(key, after, n)
+
+        else:
+            raise ValueError(f"op {n}: op desconocida {kind!r}")
+
+    if deleted:
+        ids = sorted(deleted)
+        check_days = _check_days_for_items(ids)
+        AthleteCheck.query.filter(AthleteCheck.rutina_item_id.in_(ids)).delete(synchronize_session=False)
+        for iid in ids:
+            db.session.delete(items[iid])
+            pos.pop(iid, None)
+
+    planned = _plan_positions(order, pos)
+    for tmp, it in new_items.items():
+        it.posicion = planned[tmp]
+    db.session.add_all(new_items.values())
+
+    moved = {k: p for k, p in planned.items() if not isinstance(k, str)}
+    if moved:
+        db.session.execute(
+            db.update(RutinaItem)
+            .where(RutinaItem.rutina_id == rutina.id, RutinaItem.id.in_(list(moved)))
+            .values(posicion=case(moved, value=RutinaItem.id))
+            .execution_options(synchronize_session=False)
+        )
+    db.session.flush()
+    if deleted or new_items:
+        refresh_rutina_day_stats([rutina.id], check_days if deleted else ())
+    return {tmp: it.id for tmp, it in new_items.items()}
+
+
+@main_bp.route("/rutina/<int:rutina_id>/items/batch", methods=["POST"])
+@login_required
+def rutina_items_batch(rutina_id: int):
+    """
+    JSON: {"ops": [...], "base_version": <Rutina.version leída por el builder> (opcional)}
+    => {"ok", "version", "items": [...], "ids": {tmp_id: id}}
+    Si base_version no coincide (otra pestaña editó) => 409 con el estado actual.
+    """
+    if not admin_ok():
+        return jsonify({"ok": False, "error": "Acceso denegado"}), 403
+
+    data = request.get_json(silent=True) or {}
+    ops = data.get("ops")
+    if (not isinstance(ops, list) or len(ops) > RUTINA_BATCH_MAX_OPS
+            or not all(isinstance(op, dict) for op in ops)):
+        return jsonify({"ok": False, "error": f"ops inválido (máx {RUTINA_BATCH_MAX_OPS})"}), 400
+
+    rutina = Rutina.query.filter_by(id=rutina_id).with_for_update().first_or_404()
+
+    base_version = data.get("base_version")
+    if base_version is not None and str(base_version) != str(rutina.version):
+        version = rutina.version
+        db.session.rollback()
+        return jsonify({
+            "ok": False,
+            "error": "La rutina cambió, recargá los items",
+            "version": version,
+            "items": [_item_payload(it) for it in _rutina_items_full(rutina_id)],
+        }), 409
+
+    try:
+        ids = _apply_rutina_batch(rutina, ops)
+    except (TypeError, ValueError) as e:
+        db.session.rollback()
+        return jsonify({"ok": False, "error": str(e)}), 400
+
+    if ops:
+        _bump_rutina_versions([rutina_id])
     db.session.commit()
-    return jsonify({"ok": True})
+
+    version = db.session.query(Rutina.version).filter(Rutina.id == rutina_id).scalar()
+    items = [_item_payload(it) for it in _rutina_items_full(rutina_id)]
+    return jsonify({"ok": True, "version": version, "items": items, "ids": ids})
+
+
+# =============================================================
+# CLONAR RUTINA (variantes / descarga)
+# =============================================================
+CLONE_FACTOR_MAX = 10.0
+
+
+def _scaled_count(col, factor: Optional[float]):
+    """
+    series/reps escaladas en SQL. Solo valores enteros puros ("3", "10"):
+    rangos, tiempos o "AMRAP" se copian tal cual. Mínimo 1.
+    """
+    if factor is None:
+        return col
+    scaled = cast(func.round(cast(col, db.Integer) * float(factor)), db.Integer)
+    return case(
+        (and_(col != "", func.ltrim(col, "0123456789") == ""),
+         cast(case((scaled < 1, 1), else_=scaled), db.String)),
+        else_=col,
+    )
+
+
+def clone_rutina(source_id: int, nombre: str, created_by: Optional[int] = None,
+                 series_factor: Optional[float] = None, reps_factor: Optional[float] = None,
+                 descanso: Optional[str] = None) -> tuple:
+    """
+    ✅ Duplica rutina + tabata_preset + items con 2 INSERT ... SELECT (sin pasar por Python).
+    Transforms opcionales sobre la copia: escalar series/reps, pisar descanso.
+    Devuelve (nuevo_id, items_copiados). NO hace commit.
+    """
+    src = db.select(
+        literal(nombre), Rutina.tipo, Rutina.descripcion, literal(created_by, db.Integer),
+        Rutina.tabata_preset, literal(1),
+    ).where(Rutina.id == source_id)
+    new_id = db.session.execute(
+        db.insert(Rutina)
+        .from_select(["nombre", "tipo", "descripcion", "created_by", "tabata_preset", "version"], src)
+        .returning(Rutina.id)
+    ).scalar()
+    if new_id is None:
+        return None, 0
+
+    items = db.select(
+        literal(new_id), RutinaItem.ejercicio_id, RutinaItem.nombre,
+        _scaled_count(RutinaItem.series, series_factor),
+        _scaled_count(RutinaItem.reps, reps_factor),
+        RutinaItem.peso,
+        literal(descanso) if descanso is not None else RutinaItem.descanso,
+        RutinaItem.nota, RutinaItem.posicion, RutinaItem.video_url,
+    ).where(RutinaItem.rutina_id == source_id)
+    copied = db.session.execute(
+        db.insert(RutinaItem).from_select(
+            ["rutina_id", "ejercicio_id", "nombre", "series", "reps", "peso",
+             "descanso", "nota", "posicion", "video_url"],
+            items,
+        )
+    ).rowcount
+    return new_id, copied
+
+
+def _clone_factor(value) -> Optional[float]:
+    """'' / None => sin cambio. Acepta 0.6 o '60%'."""
+    s = str(value if value is not None else "").strip().replace(",", ".")
+    if not s:
+        return None
+    pct = s.endswith("%")
+    f = float(s.rstrip("%")) / (100.0 if pct else 1.0)
+    if not 0 < f <= CLONE_FACTOR_MAX:
+        raise ValueError("factor fuera de rango")
+    return None if f == 1 else f
+
+
+@main_bp.route("/rutina/<int:rutina_id>/clone", methods=["POST"])
+@login_required
+def rutina_clone(rutina_id: int):
+    """
+    Form o JSON: nombre?, series_factor?, reps_factor? (0.6 / "60%"), descanso?
+    JSON => {"ok", "id", "items", "builder_url"}; form => redirect al builder de la copia.
+    """
+    as_json = request.is_json
+    if not admin_ok():
+        if as_json:
+            return jsonify({"ok": False, "error": "Acceso denegado"}), 403
+        flash("Acceso denegado", "danger")
+        return redirect(url_for("main.perfil_redirect"))
+
+    data = (request.get_json(silent=True) or {}) if as_json else request.form
+    src = Rutina.query.get_or_404(rutina_id)
+
+    try:
+        series_factor = _clone_factor(data.get("series_factor"))
+        reps_factor = _clone_factor(data.get("reps_factor"))
+    except ValueError:
+        if as_json:
+            return jsonify({"ok": False, "error": "Factor inválido"}), 400
+        flash("Factor inválido (ej: 0.6 o 60%)", "danger")
+        return redirect(url_for("main.rutina_builder", rutina_id=rutina_id))
+
+    nombre = (str(data.get("nombre") or "")).strip()[:140] or f"{src.nombre} (copia)"[:140]
+    descanso = (str(data.get("descanso") or "")).strip()[:40] or None
+
+    new_id, copied = clone_rutina(
+        rutina_id, nombre, created_by=current_user.id,
+        series_factor=series_factor, reps_factor=reps_factor, descanso=descanso,
+    )
+    db.session.commit()
+
+    builder_url = url_for("main.rutina_builder", rutina_id=new_id)
+    if as_json:
+        return jsonify({"ok": True, "id": new_id, "items": copied, "builder_url": builder_url})
+    flash(f"✅ Rutina duplicada ({copied} ejercicios)", "success")
+    return redirect(builder_url)
 
 
 # =============================================================
@@ -1113,14 +2604,16 @@ def rutina_tabata_settings_save(rutina_id: int):
 def rutina_tabata_player(rutina_id: int):
     rutina = Rutina.query.get_or_404(rutina_id)
 
-    ritems = (
-        RutinaItem.query
-        .filter_by(rutina_id=rutina.id)
-        .order_by(RutinaItem.posicion.asc(), RutinaItem.id.asc())
-        .all()
-    )
+    # ✅ GET condicional: el bundle solo depende de la versión de la rutina y de quién mira
+    etag = _etag_for("tabata_player", rutina.id, rutina.version, admin_ok(), current_user.id)
+    if request.method == "GET" and not session.get("_flashes") and _client_has_etag(etag):
+        return _not_modified(etag)
+
+    payload = _rutina_payloads([rutina])[rutina.id]
+    items_count = len(payload["items"])
 
-    cfg = _get_tabata_cfg(rutina, len(ritems))
+    # copia: el cfg cacheado no se toca
+    cfg = dict(payload["tabata_cfg"])
 
     if request.method == "POST":
         if not admin_ok():
@@ -1130,11 +2623,11 @@ def rutina_tabata_player(rutina_id: int):
         title = (request.form.get("title") or cfg.get("title") or "Tabata").strip()
         work = int(request.form.get("work") or cfg.get("work") or 40)
         rest = int(request.form.get("rest") or cfg.get("rest") or 20)
-        rounds = int(request.form.get("rounds") or cfg.get("rounds") or (len(ritems) or 10))
+        rounds = int(request.form.get("rounds") or cfg.get("rounds") or (items_count or 10))
         recovery = int(request.form.get("recovery") or cfg.get("finisher_rest") or 60)
 
         if rounds <= 0:
-            rounds = len(ritems) or 10
+            rounds = items_count or 10
 
         cfg.update({
             "title": title or "Tabata",
@@ -1154,39 +2647,28 @@ def rutina_tabata_player(rutina_id: int):
 
         return redirect(url_for("main.rutina_tabata_player", rutina_id=rutina.id))
 
-    items_payload: List[Dict[str, Any]] = []
-    for it in ritems:
-        video_src = ""
-
-        if getattr(it, "video_url", None):
-            v = (it.video_url or "").strip()
-            if v.startswith("http://") or v.startswith("https://"):
-                video_src = v
-            else:
-                v = v.lstrip("/").replace("\\", "/")
-                video_src = url_for("static", filename=v)
-        elif getattr(it, "ejercicio", None) and getattr(it.ejercicio, "video_filename", None):
-            if it.ejercicio.video_filename:
-                video_src = url_for("static", filename=f"videos/{it.ejercicio.video_filename}")
-
-        items_payload.append({
-            "id": it.id,
-            "nombre": it.nombre,
-            "peso": getattr(it, "peso", None),
-            "nota": getattr(it, "nota", "") or "",
-            "video_src": video_src,
-        })
+    items_payload: List[Dict[str, Any]] = [
+        {
+            "id": it["id"],
+            "nombre": it["nombre"],
+            "peso": it["peso"],
+            "nota": it["nota"],
+            "video_src": it["video_src"],
+        }
+        for it in payload["items"]
+    ]
 
     cfg_for_template = dict(cfg)
     cfg_for_template["recovery"] = int(cfg.get("finisher_rest") or 60)
 
-    return render_template(
+    resp = make_response(render_template(
         "tabata_player.html",
         rutina=rutina,
         cfg=cfg_for_template,
         items_payload=items_payload,
         is_admin=admin_ok(),
-    )
+    ))
+    return _with_etag(resp, etag)
 
 
 # =============================================================
@@ -1222,20 +2704,16 @@ def coach_planificador():
             center=center,
             prev_center=center - timedelta(days=7),
             next_center=center + timedelta(days=7),
-            ejercicios_por_grupo={},
             muscle_groups_order=MUSCLE_GROUPS_ORDER,
         )
 
     fechas = week_dates(center)
-    planes = ensure_week_plans(atleta.id, fechas)
+    planes = load_plans(atleta.id, fechas)
     semana_str = f"{fechas[0].strftime('%d/%m')} - {fechas[-1].strftime('%d/%m')}"
 
     prev_center = center - timedelta(days=7)
     next_center = center + timedelta(days=7)
 
-    ejercicios = Ejercicio.query.order_by(Ejercicio.nombre.asc()).all()
-    ejercicios_por_grupo = build_ejercicios_por_grupo(ejercicios)
-
     return render_template(
         "coach/planificador.html",
         atletas=atletas,
@@ -1247,11 +2725,172 @@ def coach_planificador():
         center=center,
         prev_center=prev_center,
         next_center=next_center,
-        ejercicios_por_grupo=ejercicios_por_grupo,
         muscle_groups_order=MUSCLE_GROUPS_ORDER,
     )
 
 
+# =============================================================
+# COPIA DE PLANES EN BLOQUE (semanas x atletas)
+# =============================================================
+PLAN_COPY_MAX_DAYS = 62
+PLAN_COPY_MAX_WEEKS = 52
+
+
+def target_athlete_ids(user_ids: Optional[List[int]] = None, grupo: str | None = None) -> List[int]:
+    """Atletas destino (no admins): lista de ids y/o todo un grupo. 1 query."""
+    ids = sorted({int(u) for u in (user_ids or []) if u})
+    if not ids and not grupo:
+        return []
+
+    q = db.session.query(User.id).filter(User.is_admin.is_(False))
+    if ids and grupo:
+        q = q.filter(or_(User.id.in_(ids), User.grupo == grupo))
+    elif ids:
+        q = q.filter(User.id.in_(ids))
+    else:
+        q = q.filter(User.grupo == grupo)
+    return sorted(uid for (uid,) in q.all())
+
+
+def copy_plans_bulk(
+    user_ids: List[int],
+    start: date,
+    end: date,
+    offsets: List[int],
+    source_user_id: Optional[int] = None,
+) -> Dict[int, Dict[str, int]]:
+    """
+    ✅ Copia [start..end] sobre cada desplazamiento de `offsets` (días) para todos
+    los atletas, con 2 statements (sin importar semanas x atletas):
+      1) cuenta días destino bloqueados ('no puedo'),
+      2) INSERT ... SELECT ... ON CONFLICT (user_id, fecha) DO UPDATE
+         ... WHERE dia_plan.puede_entrenar <> 'no' RETURNING user_id.
+
+    Origen: el plan de cada atleta, o el de `source_user_id` para todos.
+    Días origen sin fila = 'Descanso' vacío (igual que antes): pisan el destino
+    si existe; si tampoco hay fila destino no se inserta nada.
+    Copia tipo, textos, score y DiaPlan.blocks ya compilado; NO toca
+    disponibilidad ni comentario del atleta.
+
+    Devuelve {user_id: {"copied": filas escritas, "skipped": días 'no puedo'}}. NO hace commit.
+    """
+    user_ids = sorted({int(u) for u in user_ids if u})
+    offsets = sorted({int(o) for o in offsets})
+    if not user_ids or not offsets or end < start:
+        return {}
+
+    span = (end - start).days + 1
+    if span > PLAN_COPY_MAX_DAYS:
+        raise ValueError(f"Máximo {PLAN_COPY_MAX_DAYS} días de origen")
+
+    # un destino no puede pisar a otro (ni al origen si se copia sobre sí mismo):
+    # Postgres no deja que un ON CONFLICT DO UPDATE toque la misma fila dos veces
+    if any(b - a < span for a, b in zip(offsets, offsets[1:])):
+        raise ValueError("Los rangos destino se superponen")
+    if (source_user_id is None or source_user_id in user_ids) and any(abs(o) < span for o in offsets):
+        raise ValueError("El destino se superpone con el origen")
+
+    offs_sql = " UNION ALL ".join(f"SELECT {o}" for o in offsets)
+    src_ref = ":src_uid" if source_user_id is not None else "u.id"
+
+    if db_dialect() == "postgresql":
+        day0 = "CAST(:start AS DATE)"
+        next_day = "fecha + 1"
+        end_day = "CAST(:end AS DATE)"
+        target_day = "s.fecha + offs.o"
+    else:
+        day0 = ":start"
+        next_day = "date(fecha, '+1 day')"
+        end_day = ":end"
+        target_day = "date(s.fecha, offs.o || ' days')"
+
+    cte = f"""
+        WITH RECURSIVE days(fecha) AS (
+            SELECT {day0}
+            UNION ALL
+            SELECT {next_day} FROM days WHERE fecha < {end_day}
+        ),
+        offs(o) AS ({offs_sql}),
+        src AS (
+            SELECT u.id AS user_id, d.fecha AS fecha, dp.id AS src_id,
+                   COALESCE(dp.plan_type, 'Descanso') AS plan_type,
+                   COALESCE(dp.warmup, '') AS warmup,
+                   COALESCE(dp.main, '') AS main,
+                   COALESCE(dp.finisher, '') AS finisher,
+                   COALESCE(dp.propuesto_score, 0) AS propuesto_score,
+                   dp.blocks AS blocks
+            FROM users u
+            CROSS JOIN days d
+            LEFT JOIN dia_plan dp ON dp.user_id = {src_ref} AND dp.fecha = d.fecha
+            WHERE u.id IN :uids
+        ),
+        pairs AS (
+            SELECT s.user_id, {target_day} AS t_fecha, s.src_id, s.plan_type,
+                   s.warmup, s.main, s.finisher, s.propuesto_score, s.blocks
+            FROM src s
+            CROSS JOIN offs
+        )
+    """
+
+    params = {
+        "uids": user_ids,
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "now": datetime.utcnow(),
+    }
+    if source_user_id is not None:
+        params["src_uid"] = int(source_user_id)
+
+    skipped_sql = text(cte + """
+        SELECT p.user_id, COUNT(*)
+        FROM pairs p
+        JOIN dia_plan t ON t.user_id = p.user_id AND t.fecha = p.t_fecha
+        WHERE t.puede_entrenar = 'no'
+        GROUP BY p.user_id
+    """).bindparams(bindparam("uids", expanding=True))
+    skipped = {int(uid): int(n) for uid, n in db.session.execute(skipped_sql, params).all()}
+
+    upsert_sql = text(cte + """
+        INSERT INTO dia_plan (
+            user_id, fecha, plan_type, warmup, main, finisher,
+            puede_entrenar, comentario_atleta, propuesto_score, blocks, updated_at
+        )
+        SELECT p.user_id, p.t_fecha, p.plan_type, p.warmup, p.main, p.finisher,
+               'si', '', p.propuesto_score, p.blocks, :now
+        FROM pairs p
+        LEFT JOIN dia_plan t ON t.user_id = p.user_id AND t.fecha = p.t_fecha
+        WHERE p.src_id IS NOT NULL OR t.id IS NOT NULL
+        ON CONFLICT (user_id, fecha) DO UPDATE SET
+            plan_type = excluded.plan_type,
+            warmup = excluded.warmup,
+            main = excluded.main,
+            finisher = excluded.finisher,
+            propuesto_score = excluded.propuesto_score,
+            blocks = excluded.blocks,
+            updated_at = excluded.updated_at
+        WHERE dia_plan.puede_entrenar <> 'no'
+        RETURNING user_id
+    """).bindparams(
+        bindparam("uids", expanding=True),
+        bindparam("now", type_=db.DateTime),
+    )
+    copied: Dict[int, int] = {}
+    for (uid,) in db.session.execute(upsert_sql, params).all():
+        copied[int(uid)] = copied.get(int(uid), 0) + 1
+
+    return {
+        uid: {"copied": copied.get(uid, 0), "skipped": skipped.get(uid, 0)}
+        for uid in user_ids
+    }
+
+
+def _copy_offsets(start: date, end: date, weeks: int) -> List[int]:
+    """N destinos consecutivos después del origen, alineados a semanas (mismo día de semana)."""
+    span = (end - start).days + 1
+    step = -(-span // 7) * 7
+    return [step * k for k in range(1, weeks + 1)]
+
+
 @main_bp.route("/coach/copiar_semana/<int:user_id>", methods=["POST"])
 @login_required
 def coach_copiar_semana(user_id: int):
@@ -1260,79 +2899,226 @@ def coach_copiar_semana(user_id: int):
         return redirect(url_for("main.perfil_redirect"))
 
     center = parse_center_any(request.form.get("center", ""), fallback=date.today())
-
     src_dates = week_dates(center)
-    dst_dates = [d + timedelta(days=7) for d in src_dates]
 
-    src = ensure_week_plans(user_id, src_dates)
-    dst = ensure_week_plans(user_id, dst_dates)
+    res = copy_plans_bulk([user_id], src_dates[0], src_dates[-1], [7]).get(user_id) or {}
+    refresh_day_stats([user_id], src_dates[0] + timedelta(days=7), src_dates[-1] + timedelta(days=7))
+    db.session.commit()
+    flash(
+        f"✅ Semana copiada: {res.get('copied', 0)} días. "
+        f"(Saltados por 'no puedo': {res.get('skipped', 0)})",
+        "success",
+    )
+    return redirect(url_for("main.coach_planificador", user_id=user_id, center=center.isoformat()))
 
-    copied = 0
-    skipped_no_puedo = 0
 
-    for d_src in src_dates:
-        d_dst = d_src + timedelta(days=7)
+@main_bp.route("/coach/copiar_plan", methods=["POST"])
+@login_required
+def coach_copiar_plan():
+    """
+    Copia un rango (por defecto la semana de `center`) a las N semanas siguientes
+    para una lista de atletas y/o un grupo. Acepta JSON (responde JSON) o form
+    del planificador (flash + redirect).
 
-        p_src = src.get(d_src)
-        p_dst = dst.get(d_dst)
-        if not p_src or not p_dst:
-            continue
+    JSON: {from, to | center, weeks, user_ids: [...], grupo, source_user_id}
+    """
+    as_json = request.is_json
+    data = (request.get_json(silent=True) or {}) if as_json else request.form
 
-        if getattr(p_dst, "puede_entrenar", "si") == "no":
-            skipped_no_puedo += 1
-            continue
+    def fail(msg: str):
+        if as_json:
+            return jsonify({"ok": False, "error": msg}), 400
+        flash(msg, "danger")
+        return redirect(url_for("main.coach_planificador", center=data.get("center") or None))
+
+    if not admin_ok():
+        if as_json:
+            return jsonify({"ok": False, "error": "Acceso denegado"}), 403
+        flash("Acceso denegado", "danger")
+        return redirect(url_for("main.perfil_redirect"))
+
+    if data.get("from") and data.get("to"):
+        start = safe_parse_ymd(data.get("from"))
+        end = safe_parse_ymd(data.get("to"))
+    else:
+        fechas = week_dates(parse_center_any(data.get("center", ""), fallback=date.today()))
+        start, end = fechas[0], fechas[-1]
+
+    try:
+        weeks = int(data.get("weeks") or 1)
+    except (TypeError, ValueError):
+        weeks = 0
+    if not 1 <= weeks <= PLAN_COPY_MAX_WEEKS:
+        return fail(f"Semanas: entre 1 y {PLAN_COPY_MAX_WEEKS}")
+
+    raw_ids = data.get("user_ids") if as_json else request.form.getlist("user_ids")
+    if not as_json and request.form.get("user_id"):
+        raw_ids = list(raw_ids) + [request.form.get("user_id")]
+    try:
+        user_ids = [int(u) for u in (raw_ids or [])]
+    except (TypeError, ValueError):
+        return fail("user_ids inválido")
+    grupo = (data.get("grupo") or "").strip() or None
 
-        p_dst.plan_type = p_src.plan_type
-        p_dst.warmup = p_src.warmup
-        p_dst.main = p_src.main
-        p_dst.finisher = p_src.finisher
-        p_dst.propuesto_score = p_src.propuesto_score
+    source_user_id = data.get("source_user_id")
+    try:
+        source_user_id = int(source_user_id) if source_user_id else None
+    except (TypeError, ValueError):
+        return fail("source_user_id inválido")
 
-        copied += 1
+    targets = target_athlete_ids(user_ids, grupo)
+    if not targets:
+        return fail("No hay atletas destino")
 
+    offsets = _copy_offsets(start, end, weeks)
+    try:
+        results = copy_plans_bulk(targets, start, end, offsets, source_user_id)
+    except ValueError as e:
+        db.session.rollback()
+        return fail(str(e))
+    refresh_day_stats(targets, start + timedelta(days=min(offsets)), end + timedelta(days=max(offsets)))
     db.session.commit()
-    flash(f"✅ Semana copiada: {copied} días. (Saltados por 'no puedo': {skipped_no_puedo})", "success")
-    return redirect(url_for("main.coach_planificador", user_id=user_id, center=center.isoformat()))
 
+    copied = sum(r["copied"] for r in results.values())
+    skipped = sum(r["skipped"] for r in results.values())
+
+    if as_json:
+        return jsonify({
+            "ok": True,
+            "from": start.isoformat(),
+            "to": end.isoformat(),
+            "weeks": weeks,
+            "copied": copied,
+            "skipped": skipped,
+            "results": {str(uid): r for uid, r in results.items()},
+        })
 
-@main_bp.route("/dia/save", methods=["POST"])
+    flash(
+        f"✅ Plan copiado a {weeks} semana(s) para {len(results)} atleta(s): "
+        f"{copied} días. (Saltados por 'no puedo': {skipped})",
+        "success",
+    )
+    back_uid = request.form.get("user_id", type=int) or targets[0]
+    return redirect(url_for("main.coach_planificador", user_id=back_uid, center=start.isoformat()))
+
+
+# =============================================================
+# EQUIPO (COACH): semana de todos los atletas en una grilla
+# =============================================================
+TEAM_PAGE_SIZE = 40
+TEAM_PAGE_MAX = 200
+
+
+def _encode_cursor(nombre: str, user_id: int) -> str:
+    raw = json.dumps([nombre, user_id], ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor: str | None) -> Optional[tuple]:
+    if not cursor:
+        return None
+    try:
+        pad = "=" * (-len(cursor) % 4)
+        nombre, user_id = json.loads(base64.urlsafe_b64decode(cursor + pad).decode("utf-8"))
+        return str(nombre), int(user_id)
+    except Exception:
+        return None
+
+
+def team_athletes_page(grupo: str | None, after: Optional[tuple], limit: int):
+    """
+    ✅ Keyset sobre (nombre, id) (índice ix_users_nombre_id / ix_users_grupo_nombre_id):
+    el costo no depende de la página. Devuelve (atletas, next_cursor|None).
+    """
+    q = (
+        db.session.query(User.id, User.nombre, User.grupo)
+        .filter(User.is_admin.is_(False))
+    )
+    if grupo:
+        q = q.filter(User.grupo == grupo)
+    if after:
+        nombre, user_id = after
+        q = q.filter(or_(User.nombre > nombre, and_(User.nombre == nombre, User.id > user_id)))
+
+    rows = q.order_by(User.nombre.asc(), User.id.asc()).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = _encode_cursor(rows[-1].nombre, rows[-1].id) if has_more and rows else None
+    return rows, next_cursor
+
+
+@main_bp.route("/coach/equipo")
 @login_required
-def save_day():
+def coach_equipo():
     if not admin_ok():
-        flash("Solo el admin puede editar entrenamientos", "danger")
+        flash("Acceso denegado", "danger")
         return redirect(url_for("main.perfil_redirect"))
 
-    user_id = int(request.form["user_id"])
-    fecha = safe_parse_ymd(request.form["fecha"])
+    center = parse_center_any(request.args.get("center", ""), fallback=date.today())
+    grupo = (request.args.get("grupo") or "").strip() or None
+    cursor = (request.args.get("cursor") or "").strip() or None
+    limit = min(max(request.args.get("limit", type=int) or TEAM_PAGE_SIZE, 1), TEAM_PAGE_MAX)
 
-    plan = DiaPlan.query.filter_by(user_id=user_id, fecha=fecha).first()
-    if not plan:
-        plan = DiaPlan(user_id=user_id, fecha=fecha)
-        db.session.add(plan)
+    fechas = week_dates(center)
+    atletas, next_cursor = team_athletes_page(grupo, _decode_cursor(cursor), limit)
+
+    # ✅ una sola query de rango (dia_plan + athlete_logs + checks) para toda la página
+    summary = calendar_summary([a.id for a in atletas], fechas[0], fechas[-1])
+    filas = [
+        {
+            "atleta": a,
+            "dias": [summary.get((a.id, d)) for d in fechas],
+        }
+        for a in atletas
+    ]
+
+    grupos = [
+        g for (g,) in db.session.query(User.grupo)
+        .filter(User.is_admin.is_(False), User.grupo.isnot(None), User.grupo != "")
+        .distinct()
+        .order_by(User.grupo.asc())
+        .all()
+    ]
 
-    if getattr(plan, "puede_entrenar", "si") == "no":
-        flash("🚫 El atleta marcó este día como 'No puedo entrenar'.", "warning")
-        return redirect(url_for("main.coach_planificador", user_id=user_id, center=fecha.isoformat()))
+    return render_template(
+        "coach/equipo.html",
+        filas=filas,
+        fechas=fechas,
+        grupos=grupos,
+        grupo=grupo,
+        cursor=cursor,
+        next_cursor=next_cursor,
+        limit=limit,
+        center=center,
+        prev_center=center - timedelta(days=7),
+        next_center=center + timedelta(days=7),
+        semana_str=f"{fechas[0].strftime('%d/%m')} - {fechas[-1].strftime('%d/%m')}",
+    )
+
+
+PLAN_MAIN_BLOCK_TYPES = {"TABATA", "FUERZA", "STRETCH", "RUN", "BIKE", "SWIM", "FREE", "NOTE", "EJ"}
 
-    plan_type = (request.form.get("plan_type") or "Descanso").strip()
-    plan.plan_type = plan_type
 
+def _plan_fields_from_form(form) -> Dict[str, Any]:
+    """
+    Campos del plan desde el form del planificador (o un dict JSON con las mismas claves):
+    plan_type, warmup, finisher (texto) y main desde bloques b1..b4 o texto manual.
+    """
     # ⚠️ warmup/finisher vienen como texto (tu UI ya lo arma)
-    plan.warmup = (request.form.get("warmup") or "").strip()
-    plan.finisher = (request.form.get("finisher") or "").strip()
+    fields: Dict[str, Any] = {
+        "plan_type": (form.get("plan_type") or "Descanso").strip(),
+        "warmup": (form.get("warmup") or "").strip(),
+        "finisher": (form.get("finisher") or "").strip(),
+    }
 
     # MAIN: desde bloques (hasta 4) o texto manual
     lines: List[str] = []
     for i in range(1, 5):
-        btype = (request.form.get(f"b{i}_type") or "").strip().upper()
-        rid = (request.form.get(f"b{i}_rutina") or "").strip()
-        txt = (request.form.get(f"b{i}_text") or "").strip()
+        btype = (form.get(f"b{i}_type") or "").strip().upper()
+        rid = str(form.get(f"b{i}_rutina") or "").strip()
+        txt = (form.get(f"b{i}_text") or "").strip()
 
-        if not btype:
-            continue
-
-        allowed = {"TABATA", "FUERZA", "STRETCH", "RUN", "BIKE", "SWIM", "FREE", "NOTE", "EJ"}
-        if btype not in allowed:
+        if not btype or btype not in PLAN_MAIN_BLOCK_TYPES:
             continue
 
         if btype in {"TABATA", "FUERZA", "STRETCH"}:
@@ -1348,19 +3134,158 @@ def save_day():
             if txt:
                 lines.append(f"{btype}:{txt}")
 
-    manual_main = (request.form.get("main") or "").strip()
-    plan.main = "\n".join(lines) if lines else manual_main
+    manual_main = (form.get("main") or "").strip()
+    fields["main"] = "\n".join(lines) if lines else manual_main
 
     try:
-        plan.propuesto_score = int(request.form.get("propuesto_score", 0))
+        fields["propuesto_score"] = int(form.get("propuesto_score", 0))
     except Exception:
-        plan.propuesto_score = 0
+        fields["propuesto_score"] = 0
+    return fields
+
 
+def assign_plan_bulk(user_ids: List[int], fecha: date, fields: Dict[str, Any]) -> tuple:
+    """
+    ✅ Asigna el mismo día a varios atletas con UN upsert
+    (INSERT ... ON CONFLICT (user_id, fecha) DO UPDATE ... WHERE puede_entrenar <> 'no'
+    RETURNING user_id). Los bloques se compilan una sola vez y se copian a todas las filas.
+
+    Devuelve (asignados, saltados_por_no_puedo) como listas de user_id. NO hace commit.
+    """
+    user_ids = sorted({int(u) for u in user_ids if u})
+    if not user_ids:
+        return [], []
+
+    tmp = DiaPlan(
+        plan_type=fields["plan_type"],
+        warmup=fields["warmup"],
+        main=fields["main"],
+        finisher=fields["finisher"],
+    )
+    _compile_plan_blocks(tmp)
+
+    now = datetime.utcnow()
+    rows = []
+    for uid in user_ids:
+        row = _default_plan_row(uid, fecha, now)
+        row.update(fields)
+        row["blocks"] = tmp.blocks
+        rows.append(row)
+
+    table = DiaPlan.__table__
+    assigned: List[int] = []
+    for i in range(0, len(rows), PLAN_UPSERT_CHUNK):
+        stmt = dialect_insert(table).values(rows[i:i + PLAN_UPSERT_CHUNK])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.user_id, table.c.fecha],
+            set_={
+                "plan_type": stmt.excluded.plan_type,
+                "warmup": stmt.excluded.warmup,
+                "main": stmt.excluded.main,
+                "finisher": stmt.excluded.finisher,
+                "propuesto_score": stmt.excluded.propuesto_score,
+                "blocks": stmt.excluded.blocks,
+                "updated_at": stmt.excluded.updated_at,
+            },
+            where=table.c.puede_entrenar != "no",
+        ).returning(table.c.user_id)
+        assigned += [int(uid) for (uid,) in db.session.execute(stmt).all()]
+
+    done = set(assigned)
+    return sorted(done), [uid for uid in user_ids if uid not in done]
+
+
+@main_bp.route("/dia/save", methods=["POST"])
+@login_required
+def save_day():
+    if not admin_ok():
+        flash("Solo el admin puede editar entrenamientos", "danger")
+        return redirect(url_for("main.perfil_redirect"))
+
+    user_id = int(request.form["user_id"])
+    fecha = safe_parse_ymd(request.form["fecha"])
+
+    plan = DiaPlan.query.filter_by(user_id=user_id, fecha=fecha).first()
+    if not plan:
+        plan = DiaPlan(user_id=user_id, fecha=fecha)
+        db.session.add(plan)
+
+    if getattr(plan, "puede_entrenar", "si") == "no":
+        flash("🚫 El atleta marcó este día como 'No puedo entrenar'.", "warning")
+        return redirect(url_for("main.coach_planificador", user_id=user_id, center=fecha.isoformat()))
+
+    for k, v in _plan_fields_from_form(request.form).items():
+        setattr(plan, k, v)
+
+    _compile_plan_blocks(plan)
+    refresh_day_stats([user_id], fecha, fecha)
     db.session.commit()
     flash("✅ Día guardado", "success")
     return redirect(url_for("main.coach_planificador", user_id=user_id, center=fecha.isoformat()))
 
 
+@main_bp.route("/dia/save_grupo", methods=["POST"])
+@login_required
+def save_day_grupo():
+    """
+    Asigna el día a un grupo (User.grupo) y/o lista de atletas en un round trip.
+    Form del planificador (flash + redirect) o JSON:
+      {fecha, grupo, user_ids: [...], plan_type, warmup, main | b1_type.., finisher, propuesto_score}
+    """
+    as_json = request.is_json
+    data = (request.get_json(silent=True) or {}) if as_json else request.form
+
+    if not admin_ok():
+        if as_json:
+            return jsonify({"ok": False, "error": "Acceso denegado"}), 403
+        flash("Solo el admin puede editar entrenamientos", "danger")
+        return redirect(url_for("main.perfil_redirect"))
+
+    fecha = safe_parse_ymd(data.get("fecha") or "")
+    grupo = (data.get("grupo") or "").strip() or None
+    back_uid = request.form.get("user_id", type=int) if not as_json else None
+
+    raw_ids = data.get("user_ids") if as_json else request.form.getlist("user_ids")
+    try:
+        user_ids = [int(u) for u in (raw_ids or [])] + ([back_uid] if back_uid else [])
+    except (TypeError, ValueError):
+        user_ids = None
+
+    targets = target_athlete_ids(user_ids, grupo) if user_ids is not None else []
+    if not targets:
+        msg = "user_ids inválido" if user_ids is None else "No hay atletas destino"
+        if as_json:
+            return jsonify({"ok": False, "error": msg}), 400
+        flash(msg, "danger")
+        return redirect(url_for("main.coach_planificador", user_id=back_uid, center=fecha.isoformat()))
+
+    assigned, skipped = assign_plan_bulk(targets, fecha, _plan_fields_from_form(data))
+    refresh_day_stats(assigned, fecha, fecha)
+    db.session.commit()
+
+    skipped_names = [
+        n for (n,) in db.session.query(User.nombre)
+        .filter(User.id.in_(skipped))
+        .order_by(User.nombre.asc())
+        .all()
+    ] if skipped else []
+
+    if as_json:
+        return jsonify({
+            "ok": True,
+            "fecha": fecha.isoformat(),
+            "assigned": assigned,
+            "skipped": skipped,
+            "skipped_nombres": skipped_names,
+        })
+
+    msg = f"✅ Día asignado a {len(assigned)} atleta(s)."
+    if skipped_names:
+        msg += f" Saltados por 'no puedo': {', '.join(skipped_names)}"
+    flash(msg, "success")
+    return redirect(url_for("main.coach_planificador", user_id=back_uid or targets[0], center=fecha.isoformat()))
+
+
 # =============================================================
 # ADMIN CRUD
 # =============================================================
@@ -1458,9 +3383,12 @@ def admin_nuevo_ejercicio():
         nombre=nombre,
         categoria=categoria,
         descripcion=descripcion,
-        video_filename=video_filename
+        video_filename=video_filename,
+        grupo_muscular=categoria_to_muscle_group(categoria),
+        search_text=ejercicio_search_text(nombre, categoria, descripcion),
     )
     db.session.add(ejercicio)
+    bump_cache_version(CATALOG_EJERCICIOS)
     db.session.commit()
 
     flash("✅ Ejercicio creado en el banco", "success")
@@ -1482,6 +3410,7 @@ def admin_delete_user(user_id: int):
     DiaPlan.query.filter_by(user_id=user.id).delete()
     AthleteLog.query.filter_by(user_id=user.id).delete()
     AthleteCheck.query.filter_by(user_id=user.id).delete()
+    AthleteDayStat.query.filter_by(user_id=user.id).delete()
     IntegrationAccount.query.filter_by(user_id=user.id).delete()
 
     db.session.delete(user)
@@ -1494,40 +3423,17 @@ def admin_delete_user(user_id: int):
 # =============================================================
 # API: DAY DETAIL — DEVUELVE warmup/main/finisher blocks
 # =============================================================
-@main_bp.route("/api/day_detail")
-@login_required
-def api_day_detail():
-    user_id = request.args.get("user_id", type=int)
-    fecha_str = request.args.get("fecha", type=str)
-
-    if not user_id or not fecha_str:
-        return jsonify({"ok": False, "error": "Faltan parámetros"}), 400
-
-    if not (admin_ok() or current_user.id == user_id):
-        return jsonify({"ok": False, "error": "Acceso denegado"}), 403
-
-    fecha = safe_parse_ymd(fecha_str, fallback=date.today())
-
-    plan = DiaPlan.query.filter_by(user_id=user_id, fecha=fecha).first()
-    if not plan:
-        plan = DiaPlan(user_id=user_id, fecha=fecha, plan_type="Descanso")
-        db.session.add(plan)
-        db.session.commit()
+DAYS_DETAIL_MAX_DAYS = 62
 
-    log = AthleteLog.query.filter_by(user_id=user_id, fecha=fecha).first()
-    if not log:
-        log = AthleteLog(user_id=user_id, fecha=fecha, did_train=False)
-        db.session.add(log)
-        db.session.commit()
-
-    checks = AthleteCheck.query.filter_by(user_id=user_id, fecha=fecha, done=True).all()
-    done_ids = [c.rutina_item_id for c in checks if c.rutina_item_id is not None]
-
-    # ✅ NUEVO: bloques por sección
-    warmup_blocks = _build_blocks_payload_from_text(plan.warmup or "")
-    main_blocks = _build_blocks_payload_from_text(plan.main or "")
-    finisher_blocks = _build_blocks_payload_from_text(plan.finisher or "")
 
+def _day_detail_payload(
+    plan: DiaPlan,
+    log: Optional[AthleteLog],
+    done_ids: List[int],
+    warmup_blocks: List[Dict[str, Any]],
+    main_blocks: List[Dict[str, Any]],
+    finisher_blocks: List[Dict[str, Any]],
+) -> Dict[str, Any]:
     # compat legacy
     blocks_legacy = main_blocks
 
@@ -1548,7 +3454,7 @@ def api_day_detail():
             legacy_tabata_cfg = b.get("cfg")
             break
 
-    return jsonify({
+    return {
         "ok": True,
         "plan": {
             "plan_type": plan.plan_type,
@@ -1570,14 +3476,211 @@ def api_day_detail():
         "items": legacy_items_payload,
         "checks": done_ids,
         "log": {
-            "did_train": bool(log.did_train),
-            "warmup_done": getattr(log, "warmup_done", "") or "",
-            "main_done": getattr(log, "main_done", "") or "",
-            "finisher_done": getattr(log, "finisher_done", "") or "",
+            "did_train": bool(log.did_train) if log else False,
+            "warmup_done": (getattr(log, "warmup_done", "") or "") if log else "",
+            "main_done": (getattr(log, "main_done", "") or "") if log else "",
+            "finisher_done": (getattr(log, "finisher_done", "") or "") if log else "",
         },
         "is_tabata": bool(legacy_is_tabata),
         "tabata_cfg": legacy_tabata_cfg,
-    })
+    }
+
+
+def _days_etag(user_id: int, start: date, end: date, plans: List[DiaPlan]) -> str:
+    """
+    ✅ ETag fuerte SIN armar el payload: solo versiones de las filas involucradas
+    (DiaPlan.updated_at, max updated_at de logs/checks del rango, Rutina.version
+    de las rutinas referenciadas y las filas de ejercicios EJ:). Incluye si el
+    que mira es admin (cambia settings_url/builder_url).
+    """
+    plan_stamp = sorted(
+        (p.fecha.isoformat(), p.id, p.updated_at.isoformat() if p.updated_at else None)
+        for p in plans if getattr(p, "id", None)
+    )
+
+    log_stamp = db.session.query(func.count(AthleteLog.id), func.max(AthleteLog.updated_at)).filter(
+        AthleteLog.user_id == user_id,
+        AthleteLog.fecha >= start,
+        AthleteLog.fecha <= end,
+    ).one()
+    check_stamp = db.session.query(func.count(AthleteCheck.id), func.max(AthleteCheck.updated_at)).filter(
+        AthleteCheck.user_id == user_id,
+        AthleteCheck.fecha >= start,
+        AthleteCheck.fecha <= end,
+    ).one()
+
+    parsed: Dict[Any, List[Dict[str, Any]]] = {}
+    for p in plans:
+        sections = _compiled_sections(p) or _parse_plan_sections(p)
+        for sec in PLAN_SECTIONS:
+            parsed[(p.fecha, sec)] = sections[sec]
+    rutina_ids, ejercicio_ids = _collect_block_refs(parsed)
+
+    rutina_stamp = []
+    if rutina_ids:
+        rutina_stamp = sorted(
+            db.session.query(Rutina.id, Rutina.version)
+            .filter(Rutina.id.in_(sorted(rutina_ids)))
+            .all()
+        )
+    ejercicio_stamp = []
+    if ejercicio_ids:
+        ejercicio_stamp = sorted(
+            db.session.query(
+                Ejercicio.id, Ejercicio.nombre, Ejercicio.categoria,
+                Ejercicio.descripcion, Ejercicio.video_filename,
+            )
+            .filter(Ejercicio.id.in_(sorted(ejercicio_ids)))
+            .all()
+        )
+
+    return _etag_for(
+        "days", user_id, start.isoformat(), end.isoformat(), admin_ok(),
+        plan_stamp,
+        (log_stamp[0], str(log_stamp[1])),
+        (check_stamp[0], str(check_stamp[1])),
+        [tuple(r) for r in rutina_stamp],
+        [tuple(e) for e in ejercicio_stamp],
+    )
+
+
+@main_bp.route("/api/day_detail")
+@login_required
+def api_day_detail():
+    user_id = request.args.get("user_id", type=int)
+    fecha_str = request.args.get("fecha", type=str)
+
+    if not user_id or not fecha_str:
+        return jsonify({"ok": False, "error": "Faltan parámetros"}), 400
+
+    if not (admin_ok() or current_user.id == user_id):
+        return jsonify({"ok": False, "error": "Acceso denegado"}), 403
+
+    fecha = safe_parse_ymd(fecha_str, fallback=date.today())
+
+    # ✅ lectura sin efectos: si no hay fila, 'Descanso' virtual (no se inserta nada)
+    plan = (
+        DiaPlan.query.options(undefer(DiaPlan.blocks))
+        .filter_by(user_id=user_id, fecha=fecha)
+        .first()
+    ) or _virtual_plan(user_id, fecha)
+
+    log = AthleteLog.query.filter_by(user_id=user_id, fecha=fecha).first()
+
+    # ✅ If-None-Match => 304 sin armar bloques
+    etag = _days_etag(user_id, fecha, fecha, [plan])
+    if _client_has_etag(etag):
+        return _not_modified(etag)
+
+    checks = AthleteCheck.query.filter_by(user_id=user_id, fecha=fecha, done=True).all()
+    done_ids = [c.rutina_item_id for c in checks if c.rutina_item_id is not None]
+
+    # ✅ bloques por sección: desde DiaPlan.blocks (o texto legacy), resueltos en lote
+    sections = _plans_sections_payload([plan])
+
+    return _with_etag(jsonify(_day_detail_payload(
+        plan, log, done_ids,
+        sections[(fecha, "warmup")], sections[(fecha, "main")], sections[(fecha, "finisher")],
+    )), etag)
+
+
+@main_bp.route("/api/days_detail")
+@login_required
+def api_days_detail():
+    """
+    ✅ Prefetch de un rango (semana/mes) en UNA respuesta.
+    Cada día tiene el mismo shape que /api/day_detail, pero los items de cada
+    rutina van una sola vez en "rutinas" y los bloques los referencian con "items_ref".
+    No crea filas: los días sin plan salen como 'Descanso' virtual.
+    """
+    user_id = request.args.get("user_id", type=int)
+    from_str = request.args.get("from", type=str)
+    to_str = request.args.get("to", type=str)
+
+    if not user_id or not from_str or not to_str:
+        return jsonify({"ok": False, "error": "Faltan parámetros"}), 400
+
+    if not (admin_ok() or current_user.id == user_id):
+        return jsonify({"ok": False, "error": "Acceso denegado"}), 403
+
+    start = safe_parse_ymd(from_str, fallback=date.today())
+    end = safe_parse_ymd(to_str, fallback=start)
+    if end < start:
+        return jsonify({"ok": False, "error": "Rango inválido"}), 400
+    if (end - start).days + 1 > DAYS_DETAIL_MAX_DAYS:
+        return jsonify({"ok": False, "error": f"Máximo {DAYS_DETAIL_MAX_DAYS} días"}), 400
+
+    fechas = [start + timedelta(days=i) for i in range((end - start).days + 1)]
+
+    plans = {
+        p.fecha: p for p in DiaPlan.query.options(undefer(DiaPlan.blocks)).filter(
+            DiaPlan.user_id == user_id,
+            DiaPlan.fecha >= start,
+            DiaPlan.fecha <= end,
+        ).all()
+    }
+
+    etag = _days_etag(user_id, start, end, list(plans.values()))
+    if _client_has_etag(etag):
+        return _not_modified(etag)
+
+    logs = {
+        l.fecha: l for l in AthleteLog.query.filter(
+            AthleteLog.user_id == user_id,
+            AthleteLog.fecha >= start,
+            AthleteLog.fecha <= end,
+        ).all()
+    }
+    done_by_day: Dict[date, List[int]] = {}
+    for c in AthleteCheck.query.filter(
+        AthleteCheck.user_id == user_id,
+        AthleteCheck.fecha >= start,
+        AthleteCheck.fecha <= end,
+        AthleteCheck.done.is_(True),
+    ).all():
+        if c.rutina_item_id is not None:
+            done_by_day.setdefault(c.fecha, []).append(c.rutina_item_id)
+
+    for f in fechas:
+        if f not in plans:
+            plans[f] = _virtual_plan(user_id, f)
+
+    sections = _plans_sections_payload([plans[f] for f in fechas])
+
+    # items compartidos: una vez por rutina
+    rutinas_shared: Dict[str, Dict[str, Any]] = {}
+
+    def _share(blocks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        out = []
+        for b in blocks:
+            if b.get("rutina") and "items" in b:
+                rid = str(b["rutina"]["id"])
+                rutinas_shared.setdefault(rid, {"rutina": b["rutina"], "items": b["items"]})
+                b = {k: v for k, v in b.items() if k != "items"}
+                b["items_ref"] = rid
+            out.append(b)
+        return out
+
+    days: Dict[str, Dict[str, Any]] = {}
+    for f in fechas:
+        payload = _day_detail_payload(
+            plans[f], logs.get(f), done_by_day.get(f, []),
+            _share(sections[(f, "warmup")]),
+            _share(sections[(f, "main")]),
+            _share(sections[(f, "finisher")]),
+        )
+        if payload["rutina"]:
+            payload["items_ref"] = str(payload["rutina"]["id"])
+            payload["items"] = []
+        days[f.isoformat()] = payload
+
+    return _with_etag(jsonify({
+        "ok": True,
+        "from": start.isoformat(),
+        "to": end.isoformat(),
+        "days": days,
+        "rutinas": rutinas_shared,
+    }), etag)
 
 
 @main_bp.route("/athlete/check_item", methods=["POST"])
@@ -1604,6 +3707,7 @@ def athlete_check_item():
         row.done = done
 
     _set_if_attr(row, "updated_at", datetime.utcnow())
+    refresh_day_stats([user_id], fecha, fecha)
     db.session.commit()
     return jsonify({"ok": True})
 
@@ -1635,6 +3739,8 @@ def athlete_save_log():
     log.finisher_done = data.get("finisher_done") or ""
     _set_if_attr(log, "updated_at", datetime.utcnow())
 
+    update_streak_on_log(user_id, fecha, log.did_train)
+    refresh_day_stats([user_id], fecha, fecha)
     db.session.commit()
     return jsonify({"ok": True})
 
@@ -1664,11 +3770,92 @@ def athlete_save_availability():
 
     plan.puede_entrenar = "no" if no_puedo else "si"
     plan.comentario_atleta = comentario
+    refresh_day_stats([user_id], fecha, fecha)
     db.session.commit()
 
     return jsonify({"ok": True})
 
 
+# =============================================================
+# STRAVA SYNC (encola; lo procesa `flask vir strava-worker`)
+# =============================================================
+@main_bp.route("/strava/sync", methods=["POST"])
+@login_required
+def strava_sync_request():
+    from app.integrations.strava_worker import enqueue_sync, PRIORITY_MANUAL
+
+    user_id = request.form.get("user_id", type=int) or current_user.id
+    if not (admin_ok() or current_user.id == user_id):
+        flash("Acceso denegado", "danger")
+        return redirect(url_for("main.perfil_redirect"))
+
+    if not get_strava_account(user_id):
+        flash("Este usuario no tiene Strava vinculado.", "warning")
+        return redirect(url_for("main.perfil_usuario", user_id=user_id))
+
+    enqueue_sync(user_id, priority=PRIORITY_MANUAL)
+    db.session.commit()
+    flash("🔄 Sincronización de Strava en cola.", "success")
+    return redirect(url_for("main.perfil_usuario", user_id=user_id))
+
+
+# =============================================================
+# STRAVA WEBHOOK (push subscription): solo encola, responde en ms
+# =============================================================
+@main_bp.route("/strava/webhook", methods=["GET"])
+def strava_webhook_verify():
+    """Handshake de la suscripción: devolver hub.challenge si el verify_token coincide."""
+    expected = os.getenv("STRAVA_WEBHOOK_VERIFY_TOKEN", "").strip()
+    if (
+        request.args.get("hub.mode") != "subscribe"
+        or not expected
+        or request.args.get("hub.verify_token") != expected
+    ):
+        return jsonify({"ok": False, "error": "verify_token inválido"}), 403
+    return jsonify({"hub.challenge": request.args.get("hub.challenge", "")})
+
+
+@main_bp.route("/strava/webhook", methods=["POST"])
+def strava_webhook_event():
+    """
+    Eventos: activity create/update/delete => job "activity" para el worker;
+    athlete update con authorized=false => job "deauth" (el worker lo confirma con Strava
+    antes de borrar los tokens). Exige STRAVA_WEBHOOK_SUBSCRIPTION_ID (403 si falta o no
+    coincide); eventos válidos pero ajenos => 200 y se ignoran.
+    """
+    from app.integrations.strava_worker import enqueue_activity_event, enqueue_deauth_check
+
+    ev = request.get_json(silent=True) or {}
+    # el POST no viene firmado: sin subscription_id configurado no se acepta nada
+    sub_id = os.getenv("STRAVA_WEBHOOK_SUBSCRIPTION_ID", "").strip()
+    if not sub_id or str(ev.get("subscription_id") or "") != sub_id:
+        return jsonify({"ok": False, "error": "subscription_id inválido"}), 403
+
+    owner_id = str(ev.get("owner_id") or "")
+    acc = IntegrationAccount.query.filter_by(provider="strava", external_user_id=owner_id).first() if owner_id else None
+    if not acc:
+        return jsonify({"ok": True, "ignored": "owner"})
+
+    object_type = ev.get("object_type")
+    aspect = ev.get("aspect_type")
+    updates = ev.get("updates") or {}
+
+    if object_type == "athlete" and str(updates.get("authorized", "")).lower() == "false":
+        if str(ev.get("object_id") or "") != owner_id:
+            return jsonify({"ok": True, "ignored": "event"})
+        # no se borra nada acá: el worker confirma con Strava que el token ya no sirve
+        enqueue_deauth_check(acc.user_id)
+        db.session.commit()
+        return jsonify({"ok": True, "queued": True})
+
+    if object_type == "activity" and aspect in ("create", "update", "delete") and ev.get("object_id"):
+        enqueue_activity_event(acc.user_id, str(ev["object_id"]), aspect)
+        db.session.commit()
+        return jsonify({"ok": True, "queued": True})
+
+    return jsonify({"ok": True, "ignored": "event"})
+
+
 # =============================================================
 # STRAVA OAUTH (SIN BLUEPRINT EXTRA)
 # =============================================================
@@ -1707,17 +3894,7 @@ def strava_callback():
         return redirect(url_for("main.perfil_usuario", user_id=current_user.id))
 
     try:
-        resp = requests.post(
-            "https://www.strava.com/oauth/token",
-            data={
-                "client_id": client_id,
-                "client_secret": client_secret,
-                "code": code,
-                "grant_type": "authorization_code",
-            },
-            timeout=20,
-        )
-        data = resp.json()
+        data = exchange_code_for_token(code)
     except Exception as e:
         flash(f"Strava: error conectando con Strava ({e}).", "danger")
         return redirect(url_for("main.perfil_usuario", user_id=current_user.id))
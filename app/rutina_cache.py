@@ -0,0 +1,9 @@
+# app/rutina_cache.py
+from __future__ import annotations
+
+import os
+
+from app.versioned_cache import VersionedCache
+
+# payload de una rutina (items + cfg tabata), clave rutina_id, versión Rutina.version
+rutina_cache = VersionedCache(maxsize=int(os.getenv("RUTINA_CACHE_SIZE", "512")))
@@ -32,6 +32,8 @@ def fix_schema() -> None:
     if _table_exists("users"):
         _sql_exec("ALTER TABLE users ADD COLUMN IF NOT EXISTS is_admin BOOLEAN DEFAULT FALSE;")
         _sql_exec("ALTER TABLE users ADD COLUMN IF NOT EXISTS fecha_creacion TIMESTAMP DEFAULT NOW();")
+        _sql_exec("CREATE INDEX IF NOT EXISTS ix_users_nombre_id ON users (nombre, id);")
+        _sql_exec("CREATE INDEX IF NOT EXISTS ix_users_grupo_nombre_id ON users (grupo, nombre, id);")
 
     # dia_plan FK (limpia huérfanos antes)
     if _table_exists("dia_plan"):
@@ -67,9 +69,31 @@ def fix_schema() -> None:
             ON DELETE CASCADE;
         """)
 
+    # dia_plan.blocks (bloques compilados) + rutinas.version
+    if _table_exists("dia_plan"):
+        _sql_exec("ALTER TABLE dia_plan ADD COLUMN IF NOT EXISTS blocks JSONB;")
+        _sql_exec("ALTER TABLE dia_plan ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT NOW();")
+        # días que usan una rutina (refresh de adherencia al editar items): blocks -> 'rutinas' ?| ...
+        _sql_exec("CREATE INDEX IF NOT EXISTS ix_dia_plan_blocks_rutinas ON dia_plan USING gin ((blocks -> 'rutinas'));")
+
+    if _table_exists("rutinas"):
+        _sql_exec("ALTER TABLE rutinas ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1;")
+
     # STRAVA: columnas faltantes
     if _table_exists("integration_accounts"):
         _sql_exec("ALTER TABLE integration_accounts ADD COLUMN IF NOT EXISTS external_user_id VARCHAR(80);")
+        _sql_exec("ALTER TABLE integration_accounts ADD COLUMN IF NOT EXISTS sync_after INTEGER;")
+        _sql_exec("ALTER TABLE integration_accounts ADD COLUMN IF NOT EXISTS sync_last_activity_id VARCHAR(80);")
+        _sql_exec("ALTER TABLE integration_accounts ADD COLUMN IF NOT EXISTS sync_cursor JSON;")
+        _sql_exec("ALTER TABLE integration_accounts ADD COLUMN IF NOT EXISTS last_sync_at TIMESTAMP;")
+        _sql_exec("CREATE INDEX IF NOT EXISTS ix_integration_accounts_provider_external ON integration_accounts (provider, external_user_id);")
+
+    if _table_exists("ejercicios"):
+        _sql_exec("ALTER TABLE ejercicios ADD COLUMN IF NOT EXISTS grupo_muscular VARCHAR(40);")
+        _sql_exec("CREATE INDEX IF NOT EXISTS ix_ejercicios_grupo_nombre ON ejercicios (grupo_muscular, nombre);")
+        _sql_exec("ALTER TABLE ejercicios ADD COLUMN IF NOT EXISTS search_text TEXT;")
+        _sql_exec("CREATE EXTENSION IF NOT EXISTS pg_trgm;")
+        _sql_exec("CREATE INDEX IF NOT EXISTS ix_ejercicios_search_trgm ON ejercicios USING gin (search_text gin_trgm_ops);")
 
     if _table_exists("external_activities"):
         _sql_exec("ALTER TABLE external_activities ADD COLUMN IF NOT EXISTS start_date TIMESTAMP;")
@@ -79,6 +103,8 @@ def fix_schema() -> None:
         _sql_exec("ALTER TABLE external_activities ADD COLUMN IF NOT EXISTS raw_json JSON;")
         _sql_exec("ALTER TABLE external_activities ADD COLUMN IF NOT EXISTS created_at TIMESTAMP DEFAULT NOW();")
         _sql_exec("ALTER TABLE external_activities ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT NOW();")
+        _sql_exec("CREATE INDEX IF NOT EXISTS ix_external_activities_user_start ON external_activities (user_id, start_date);")
+        _sql_exec("ALTER TABLE external_activities ADD COLUMN IF NOT EXISTS payload_hash VARCHAR(64);")
 
     # ✅ RUTINAS: columnas que te faltan y están rompiendo /builder
     if _table_exists("rutina_items"):
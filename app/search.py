@@ -0,0 +1,187 @@
+# app/search.py
+from __future__ import annotations
+
+import re
+import unicodedata
+from typing import List, Optional
+
+from sqlalchemy import text
+
+from app.extensions import db
+from app.models import Ejercicio
+
+# Backend de búsqueda por proceso: "trgm" (Postgres + pg_trgm), "fts5" (SQLite) o "like".
+_BACKEND: dict = {"name": None}
+
+SEARCH_MAX_TOKENS = 6
+
+
+def normalize_search(s: str | None) -> str:
+    """minúsculas, sin tildes, solo letras/números separados por un espacio."""
+    s = unicodedata.normalize("NFKD", s or "")
+    s = "".join(ch for ch in s if not unicodedata.combining(ch)).lower()
+    return " ".join(re.findall(r"[a-z0-9]+", s))
+
+
+def ejercicio_search_text(nombre: str | None, categoria: str | None, descripcion: str | None) -> str:
+    """
+    Texto indexado de un ejercicio. Empieza SIEMPRE por el nombre normalizado:
+    así `search_text LIKE 'q%'` = el nombre empieza con q (boost de typeahead).
+    """
+    return " ".join(p for p in (
+        normalize_search(nombre),
+        normalize_search(categoria),
+        normalize_search(descripcion),
+    ) if p)
+
+
+def _tokens(q: str) -> List[str]:
+    return normalize_search(q).split()[:SEARCH_MAX_TOKENS]
+
+
+def ensure_search_index() -> str:
+    """
+    Crea el índice de texto si falta (idempotente, hace DDL + commit: solo desde
+    `flask vir search-index` / migraciones, nunca en un request) y devuelve el backend:
+      - Postgres: pg_trgm + GIN (search_text gin_trgm_ops) => LIKE '%tok%' indexado.
+      - SQLite: tabla FTS5 external-content sobre ejercicios.search_text + triggers.
+      - Si no se puede (sin permisos / sin FTS5): "like" (scan).
+    """
+    dialect = db.engine.dialect.name
+    try:
+        if dialect == "postgresql":
+            db.session.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+            db.session.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_ejercicios_search_trgm "
+                "ON ejercicios USING gin (search_text gin_trgm_ops)"
+            ))
+            db.session.commit()
+            _BACKEND["name"] = "trgm"
+            return "trgm"
+
+        if dialect == "sqlite":
+            exists = db.session.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'ejercicios_fts'"
+            )).scalar()
+            if not exists:
+                db.session.execute(text(
+                    "CREATE VIRTUAL TABLE ejercicios_fts USING fts5("
+                    "search_text, content='ejercicios', content_rowid='id')"
+                ))
+                db.session.execute(text("""
+                    CREATE TRIGGER IF NOT EXISTS ejercicios_fts_ai AFTER INSERT ON ejercicios BEGIN
+                        INSERT INTO ejercicios_fts(rowid, search_text) VALUES (new.id, new.search_text);
+                    END
+                """))
+                db.session.execute(text("""
+                    CREATE TRIGGER IF NOT EXISTS ejercicios_fts_ad AFTER DELETE ON ejercicios BEGIN
+                        INSERT INTO ejercicios_fts(ejercicios_fts, rowid, search_text)
+                        VALUES ('delete', old.id, old.search_text);
+                    END
+                """))
+                db.session.execute(text("""
+                    CREATE TRIGGER IF NOT EXISTS ejercicios_fts_au AFTER UPDATE OF search_text ON ejercicios BEGIN
+                        INSERT INTO ejercicios_fts(ejercicios_fts, rowid, search_text)
+                        VALUES ('delete', old.id, old.search_text);
+                        INSERT INTO ejercicios_fts(rowid, search_text) VALUES (new.id, new.search_text);
+                    END
+                """))
+                db.session.execute(text("INSERT INTO ejercicios_fts(ejercicios_fts) VALUES ('rebuild')"))
+                db.session.commit()
+            _BACKEND["name"] = "fts5"
+            return "fts5"
+    except Exception as e:
+        db.session.rollback()
+        print("⚠️ search index:", e)
+    return "like"
+
+
+def detect_search_backend() -> str:
+    """Solo lectura (sin DDL): qué índice hay. Lo crean auto_migrate / `flask vir search-index`."""
+    dialect = db.engine.dialect.name
+    try:
+        if dialect == "postgresql":
+            found = db.session.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")).scalar()
+            return "trgm" if found else "like"
+        if dialect == "sqlite":
+            found = db.session.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'ejercicios_fts'"
+            )).scalar()
+            return "fts5" if found else "like"
+    except Exception as e:
+        db.session.rollback()
+        print("⚠️ search backend:", e)
+    return "like"
+
+
+def search_backend() -> str:
+    # "like" no se cachea: si después se crea el índice, el proceso lo toma sin reiniciar
+    if _BACKEND["name"] is None:
+        backend = detect_search_backend()
+        if backend == "like":
+            return backend
+        _BACKEND["name"] = backend
+    return _BACKEND["name"]
+
+
+def backfill_search_text(recompute_all: bool = False) -> int:
+    """Completa Ejercicio.search_text (filas legacy). Devuelve cuántas actualizó. NO hace commit."""
+    q = db.session.query(Ejercicio.id, Ejercicio.nombre, Ejercicio.categoria,
+                         Ejercicio.descripcion, Ejercicio.search_text)
+    if not recompute_all:
+        q = q.filter(Ejercicio.search_text.is_(None))
+
+    updates = []
+    for eid, nombre, categoria, descripcion, actual in q.all():
+        st = ejercicio_search_text(nombre, categoria, descripcion)
+        if st != actual:
+            updates.append({"id": eid, "search_text": st})
+    if updates:
+        db.session.execute(db.update(Ejercicio), updates)
+    return len(updates)
+
+
+def search_ejercicio_ids(q: str, limit: int = 20, grupo: Optional[str] = None) -> List[int]:
+    """
+    ✅ ids rankeados para `q` (sin tildes, prefijo por token, AND entre tokens).
+    Orden: nombre empieza con q > relevancia (similarity / bm25) > nombre.
+    """
+    tokens = _tokens(q)
+    if not tokens:
+        return []
+
+    qn = " ".join(tokens)
+    params = {"q": qn, "prefix": f"{qn}%", "limit": int(limit)}
+    grupo_sql = ""
+    if grupo:
+        grupo_sql = " AND e.grupo_muscular = :grupo"
+        params["grupo"] = grupo
+
+    backend = search_backend()
+
+    if backend == "fts5":
+        # "tok"* = prefijo; tokens ya normalizados (solo [a-z0-9])
+        params["match"] = " ".join(f'"{t}"*' for t in tokens)
+        sql = f"""
+            SELECT e.id
+            FROM ejercicios_fts
+            JOIN ejercicios e ON e.id = ejercicios_fts.rowid
+            WHERE ejercicios_fts MATCH :match{grupo_sql}
+            ORDER BY (e.search_text LIKE :prefix) DESC, bm25(ejercicios_fts), e.nombre
+            LIMIT :limit
+        """
+    else:
+        likes = []
+        for i, t in enumerate(tokens):
+            params[f"t{i}"] = f"%{t}%"
+            likes.append(f"e.search_text LIKE :t{i}")
+        rank = "similarity(e.search_text, :q) DESC, " if backend == "trgm" else ""
+        sql = f"""
+            SELECT e.id
+            FROM ejercicios e
+            WHERE {" AND ".join(likes)}{grupo_sql}
+            ORDER BY (e.search_text LIKE :prefix) DESC, {rank}e.nombre
+            LIMIT :limit
+        """
+
+    return [int(r[0]) for r in db.session.execute(text(sql), params).all()]
@@ -0,0 +1,56 @@
+# app/versioned_cache.py
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+
+class VersionedCache:
+    """
+    Cache LRU en memoria (por proceso) de payloads armados una vez.
+
+    Cada entrada guarda la versión con la que se armó (Rutina.version, cache_versions, ...):
+    el caller SIEMPRE pasa la versión leída de la DB, así con varios workers de
+    gunicorn nunca se sirve un payload viejo (si otro worker invalidó, la versión
+    no coincide => miss).
+    """
+
+    def __init__(self, maxsize: int = 512):
+        self.maxsize = max(1, int(maxsize))
+        self._data: "OrderedDict[Hashable, Tuple[int, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, version: int) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, version: int, payload: Any) -> None:
+        with self._lock:
+            self._data[key] = (version, payload)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 3) if total else 0.0,
+            }
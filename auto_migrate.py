@@ -55,6 +55,8 @@ with app.app_context():
     if table_exists("users"):
         sql_exec("ALTER TABLE users ADD COLUMN IF NOT EXISTS is_admin BOOLEAN DEFAULT FALSE;")
         sql_exec("ALTER TABLE users ADD COLUMN IF NOT EXISTS fecha_creacion TIMESTAMP DEFAULT NOW();")
+        sql_exec("CREATE INDEX IF NOT EXISTS ix_users_nombre_id ON users (nombre, id);")
+        sql_exec("CREATE INDEX IF NOT EXISTS ix_users_grupo_nombre_id ON users (grupo, nombre, id);")
 
     # 3) Fix FK dia_plan -> users (limpieza de huérfanos + FK)
     if table_exists("dia_plan"):
@@ -89,7 +91,43 @@ with app.app_context():
             ON DELETE CASCADE;
         """)
 
-    # 5) Admin
+    # 5) Bloques compilados del plan + versión de rutina
+    if table_exists("dia_plan"):
+        sql_exec("ALTER TABLE dia_plan ADD COLUMN IF NOT EXISTS blocks JSONB;")
+        sql_exec("ALTER TABLE dia_plan ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT NOW();")
+        # días que usan una rutina (refresh de adherencia al editar items): blocks -> 'rutinas' ?| ...
+        sql_exec("CREATE INDEX IF NOT EXISTS ix_dia_plan_blocks_rutinas ON dia_plan USING gin ((blocks -> 'rutinas'));")
+
+    if table_exists("rutinas"):
+        sql_exec("ALTER TABLE rutinas ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1;")
+
+    if table_exists("ejercicios"):
+        sql_exec("ALTER TABLE ejercicios ADD COLUMN IF NOT EXISTS grupo_muscular VARCHAR(40);")
+        sql_exec("CREATE INDEX IF NOT EXISTS ix_ejercicios_grupo_nombre ON ejercicios (grupo_muscular, nombre);")
+        sql_exec("ALTER TABLE ejercicios ADD COLUMN IF NOT EXISTS search_text TEXT;")
+        sql_exec("CREATE EXTENSION IF NOT EXISTS pg_trgm;")
+        sql_exec("CREATE INDEX IF NOT EXISTS ix_ejercicios_search_trgm ON ejercicios USING gin (search_text gin_trgm_ops);")
+        try:
+            from app.search import backfill_search_text
+            n = backfill_search_text()
+            db.session.commit()
+            print(f"✅ ejercicios.search_text completados: {n}")
+        except Exception as e:
+            db.session.rollback()
+            print(f"⚠️ Error completando search_text: {e}")
+
+    if table_exists("integration_accounts"):
+        sql_exec("ALTER TABLE integration_accounts ADD COLUMN IF NOT EXISTS sync_after INTEGER;")
+        sql_exec("ALTER TABLE integration_accounts ADD COLUMN IF NOT EXISTS sync_last_activity_id VARCHAR(80);")
+        sql_exec("ALTER TABLE integration_accounts ADD COLUMN IF NOT EXISTS sync_cursor JSON;")
+        sql_exec("ALTER TABLE integration_accounts ADD COLUMN IF NOT EXISTS last_sync_at TIMESTAMP;")
+        sql_exec("CREATE INDEX IF NOT EXISTS ix_integration_accounts_provider_external ON integration_accounts (provider, external_user_id);")
+
+    if table_exists("external_activities"):
+        sql_exec("CREATE INDEX IF NOT EXISTS ix_external_activities_user_start ON external_activities (user_id, start_date);")
+        sql_exec("ALTER TABLE external_activities ADD COLUMN IF NOT EXISTS payload_hash VARCHAR(64);")
+
+    # 6) Admin
     try:
         ensure_admin()
     except Exception as e: